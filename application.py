@@ -34,8 +34,15 @@ class Application(object):
         subreddit = request.args.get('subreddit')
         if subreddit is None:
             subreddit = 'UNK'
-        predictions = self.model.predict(text_to_predict, subreddit)
+        k = request.args.get('k', type=int)
         result = {'predicted':text_to_predict,
-                  'subreddit':subreddit,
-                  'predictions':predictions}
+                  'subreddit':subreddit}
+        if k is None:
+            result['predictions'] = \
+                self.model.predict(text_to_predict, subreddit)
+        else:
+            # The k most likely users, with their scores
+            top_users = self.model.predict_top_k(text_to_predict, subreddit, k)
+            result['predictions'] = [user for user, _ in top_users]
+            result['scores'] = [score for _, score in top_users]
         return json.dumps(result)
@@ -0,0 +1,133 @@
+# MIT License
+#
+# Copyright (c) 2017 Jonatan Almén, Alexander Håkansson, Jesper Jaxing, Gmal
+# Tchaefa, Maxim Goretskyy, Axel Olivecrona
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+""" Measures the training throughput of configs
+
+Every config is built once per variant, where a variant overrides some of
+its values, and a number of training steps are timed. For example, to
+compare the RNN implementations of config 0:
+
+    python benchmark.py 0 --variant rnn_impl=standard --variant rnn_impl=fused
+
+or the optimizers of a config with a trainable embedding matrix:
+
+    python benchmark.py 0 --variant optimizer=adam --variant optimizer=lazy_adam
+"""
+import sys
+import time
+import shutil
+import argparse
+import yaml
+import tensorflow as tf
+from definitions import *
+from model.util.networkconfig import yamlconfig as networkconfig, \
+    sessionconfig
+from model.util.session_config import session_settings, session_config
+from model.util.folder_builder import build_structure
+from model.model_builder import ModelBuilder
+
+
+def parse_variant(variant):
+    """ Parses a variant like 'rnn_impl=fused,rnn_unit=gru' into a dict of
+    config overrides """
+    overrides = {}
+    for override in variant.split(','):
+        key, value = override.split('=', 1)
+        overrides[key.strip()] = yaml.safe_load(value)
+    return overrides
+
+
+def scratch_config(config, name):
+    """ The config logging to a scratch directory of its own, so the
+    checkpoints and TensorBoard logs of the real config are neither
+    restored nor written """
+    return dict(config, **{'type': 'benchmark', NET_NAME: name})
+
+
+def time_training(config, steps, warmup):
+    """ Builds the model of a config with fresh variables and returns how
+    many training steps it runs per second, after warmup steps that aren't
+    timed. The config should log to a scratch directory, which is removed
+    before and after """
+    settings = session_settings(sessionconfig)
+    logging_dir = build_structure(config)
+    shutil.rmtree(logging_dir)
+    try:
+        config_proto = session_config(settings)
+        with tf.Session(config=config_proto) as sess:
+            model = ModelBuilder(config, sess,
+                                 session_config=config_proto).build()
+            for _ in range(warmup):
+                model.train_batch()
+            start = time.perf_counter()
+            for _ in range(steps):
+                model.train_batch()
+            elapsed = time.perf_counter() - start
+            model.close_writers()
+    finally:
+        tf.reset_default_graph()
+        shutil.rmtree(logging_dir, ignore_errors=True)
+    return steps / elapsed
+
+
+def main():
+    """ Times every config with every variant and prints the results """
+    parser = argparse.ArgumentParser(add_help=True)
+    parser.add_argument('configs', metavar='C', type=int, nargs='*',
+                        help='Config number to use (can be multiple)')
+    parser.add_argument('--variant', action='append', default=[],
+                        help='Config overrides to time, e.g. rnn_impl=fused '
+                             '(can be multiple)')
+    parser.add_argument('--steps', type=int, default=200,
+                        help='Number of timed training steps')
+    parser.add_argument('--warmup', type=int, default=20,
+                        help='Number of training steps before timing')
+    args = parser.parse_args()
+
+    variants = args.variant or ['rnn_impl=standard', 'rnn_impl=fused']
+    results = []
+    for conf in args.configs if args.configs else range(len(networkconfig)):
+        for number, variant in enumerate(variants):
+            name = networkconfig[conf][NET_NAME]
+            config = dict(networkconfig[conf])
+            config.update(parse_variant(variant))
+            config = scratch_config(config, '%s-variant%d' % (name, number))
+            print("Timing config", conf, "with", variant)
+            try:
+                steps_per_sec = time_training(config, args.steps,
+                                              args.warmup)
+            except Exception as e:
+                print("Config ", name, "failed to complete",
+                      file=sys.stderr)
+                print(e, file=sys.stderr)
+                tf.reset_default_graph()
+                continue
+            results.append((name, variant, steps_per_sec))
+
+    print("{:<40} {:<40} {:>10}".format("config", "variant", "steps/sec"))
+    for name, variant, steps_per_sec in results:
+        print("{:<40} {:<40} {:>10.2f}".format(name, variant, steps_per_sec))
+
+
+if __name__ == "__main__":
+    main()
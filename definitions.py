@@ -26,11 +26,17 @@ import os
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 DATASETS_PATH = os.path.join(ROOT_DIR, "resources/datasets")
+CACHE_PATH = os.path.join(DATASETS_PATH, "cache")
 LOGS_DIR = os.path.join(ROOT_DIR, "logs")
 
 TENSOR_DIR_TRAIN = 'tensorDir/train'
 TENSOR_DIR_VALID = 'tensorDir/valid'
 CHECKPOINTS_DIR = 'checkpoints'
+FROZEN_MODEL = 'frozen_model.pb'
+QUANTIZED_MODEL = 'quantized.npz'
+SERVING_DATA = 'serving.json'
+SESSION_LOG = 'session.json'
+RECORDS_DIR = 'records'
 LOGGING_RESULTS_FILE = os.path.join(LOGS_DIR, 'logs_results_all.csv')
 
 NET_TYPE = 'type'
@@ -38,29 +44,54 @@ NET_NAME = 'name'
 VOC_SIZE = 'vocabulary_size'
 USER_COUNT = 'user_count'
 LEARN_RATE = 'learning_rate'
+OPTIMIZER = 'optimizer'
+SAMPLED_NEGATIVES = 'sampled_negatives'
 EMBEDD_SIZE = 'embedding_size'
 MAX_TITLE_LENGTH = 'max_title_length'
 RNN_NEURONS = 'rnn_neurons'
 RNN_UNIT = "rnn_unit"
+RNN_IMPL = 'rnn_impl'
 HIDDEN_NEURONS = 'hidden_neurons'
 HIDDEN_LAYERS = 'hidden_layers'
 SUB_INPUT_NEURONS = 'subreddit_input_neurons'
 USE_CONCAT_INPUT = 'use_concat_input'
+USE_SUBREDDIT_IDS = 'use_subreddit_ids'
 BATCH_SIZE = 'batch_size'
+USE_INPUT_PIPELINE = 'use_input_pipeline'
+RECORD_SHARDS = 'record_shards'
+SHUFFLE_BUFFER = 'shuffle_buffer'
+BUCKET_BY_LENGTH = 'bucket_by_length'
+BUCKET_WIDTH = 'bucket_width'
 TRAINING_EPOCHS = 'training_epochs'
+EVAL_BATCH_SIZE = 'eval_batch_size'
+TRAINING_METRICS = 'training_metrics'
+TRAINING_SAMPLE_SIZE = 'training_sample_size'
+EARLY_STOPPING_PATIENCE = 'early_stopping_patience'
+EARLY_STOPPING_MIN_DELTA = 'early_stopping_min_delta'
+KEEP_BEST_CHECKPOINTS = 'keep_best_checkpoints'
+CHECKPOINT_QUEUE_SIZE = 'checkpoint_queue_size'
 USE_L2_LOSS = 'use_l2_loss'
 L2_FACTOR = 'l2_factor'
 USE_DROPOUT = 'use_dropout'
 DROPOUT_PROB = 'dropout_prob'
+SPARSE_LABELS = 'sparse_labels'
 USE_CONSTANT_LIMIT = 'use_constant_limit'
 CONSTANT_PREDICTION_LIMIT = 'constant_prediction_limit'
+QUANTIZED_EMBEDDINGS = 'quantized_embeddings'
+QUANTIZED_WEIGHTS = 'quantized_weights'
 TRAINABLE_MATRIX = 'trainable_matrix'
 PRE_TRAINED_MATRIX = 'pre_trained_matrix'
 USE_PRETRAINED = 'use_pretrained'
+PRUNE_EMBEDDINGS = 'prune_embeddings'
 USE_PRETRAINED_NET = 'pre_train_subreddit'
 VALIDATION_DATA = 'validation_data'
 TRAINING_DATA = 'training_data'
 TESTING_DATA = 'testing_data'
+USE_DATA_CACHE = 'use_data_cache'
+INGEST_WORKERS = 'ingest_workers'
+INGEST_CHUNK_SIZE = 'ingest_chunk_size'
+STREAMING = 'streaming'
+STREAM_CHUNK_SIZE = 'stream_chunk_size'
 
 F1_SCORE_TOP_VALID = 'F1 Score highest valid'
 F1_SCORE_TRAIN = 'F1 Score training'
@@ -69,4 +100,14 @@ PRECISION_VALIDATION = 'Precision validation'
 PRECISION_TRAINING = 'Precision training'
 RECALL_VALIDATION = 'Recall validation'
 RECALL_TRAINING = 'Recall training'
-DATE = 'Date of experiment'
\ No newline at end of file
+DATE = 'Date of experiment'
+
+# Session configs
+SESSION = 'session'
+INTRA_OP_THREADS = 'intra_op_threads'
+INTER_OP_THREADS = 'inter_op_threads'
+CPU_AFFINITY = 'cpu_affinity'
+GRAPH_OPTIMIZATION = 'graph_optimization'
+GLOBAL_JIT = 'global_jit'
+ALLOW_GROWTH = 'allow_growth'
+LOG_DEVICE_PLACEMENT = 'log_device_placement'
@@ -21,13 +21,23 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 # ==============================================================================
-import sys
+import os.path
 import argparse
 import tensorflow as tf
 from definitions import *
 from application import Application
-from model.util.networkconfig import yamlconfig as networkconfig
+from model.util.networkconfig import yamlconfig as networkconfig, \
+    sessionconfig
 from model.model_builder import ModelBuilder
+from model.trainer import train_config
+from model.sweep import run_sweep
+from model.distributed import cluster_spec, run_local, run_task
+from model.serving import FrozenModel
+from model.util.data import ServingData
+from model.util import quantize
+from model.util.session_config import session_settings, session_config, \
+    log_settings
+from model.util.folder_builder import build_structure
 
 def main():
     """ A main method that creates the model and starts training it """
@@ -36,35 +46,160 @@ def main():
     parser.add_argument('configs', metavar='C', type=int, nargs='*',
                         help='Config number to use (can be multiple)')
     parser.add_argument('--application', action='store_true')
+    parser.add_argument('--quantized', action='store_true',
+                        help='Serve the quantized export of the model')
+    parser.add_argument('--export', action='store_true',
+                        help='Export frozen inference graphs of trained '
+                             'configs for serving')
+    parser.add_argument('--export-quantized', action='store_true',
+                        help='Export quantized models of trained configs '
+                             'and report their accuracy and latency')
+    parser.add_argument('--sweep', action='store_true',
+                        help='Train the configs concurrently in a pool of '
+                             'processes')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Processes used by --sweep, 0 uses all cores')
+    parser.add_argument('--cores-per-worker', type=int, default=4,
+                        help='Cores each --sweep process is pinned to')
+    # Data parallel training
+    parser.add_argument('--local-workers', type=int, default=0,
+                        help='Train each config with this many worker '
+                             'processes on this machine')
+    parser.add_argument('--parameter-servers', type=int, default=1,
+                        help='Parameter server processes of '
+                             '--local-workers')
+    parser.add_argument('--port', type=int, default=2222,
+                        help='First port used by --local-workers')
+    parser.add_argument('--job-name', choices=['ps', 'worker'],
+                        help='Run a task of a cluster across machines')
+    parser.add_argument('--task-index', type=int, default=0,
+                        help='Index of the task within its job')
+    parser.add_argument('--ps-hosts',
+                        help='Parameter servers, like host1:2222,host2:2222')
+    parser.add_argument('--worker-hosts',
+                        help='Workers, like host1:2223,host2:2223')
+    # Overrides of the session block of config.yaml
+    parser.add_argument('--intra-op-threads', type=int,
+                        help='Threads of a single operation, 0 for all cores')
+    parser.add_argument('--inter-op-threads', type=int,
+                        help='Operations run in parallel, 0 for all cores')
+    parser.add_argument('--cpu-affinity',
+                        help='Cores to run on, like 0-7,16')
+    parser.add_argument('--graph-optimization', choices=['L0', 'L1'],
+                        help='Graph optimizations, L0 turns them off')
+    parser.add_argument('--global-jit', action='store_const', const=True,
+                        help='Compile the graph with XLA')
     args = parser.parse_args()
+    if args.job_name and not (args.ps_hosts and args.worker_hosts):
+        parser.error('--job-name requires --ps-hosts and --worker-hosts')
+    settings = session_settings(sessionconfig, {
+        INTRA_OP_THREADS: args.intra_op_threads,
+        INTER_OP_THREADS: args.inter_op_threads,
+        CPU_AFFINITY: args.cpu_affinity,
+        GRAPH_OPTIMIZATION: args.graph_optimization,
+        GLOBAL_JIT: args.global_jit})
     if args.application:
         conf_num = args.configs[0] if args.configs else 0
-        serve_application(conf_num)
+        serve_application(conf_num, args.quantized, settings)
+    elif args.export:
+        for conf in args.configs if args.configs else range(len(networkconfig)):
+            export_frozen(conf, settings)
+    elif args.export_quantized:
+        for conf in args.configs if args.configs else range(len(networkconfig)):
+            export_quantized(conf, settings)
+    elif args.local_workers:
+        for conf in args.configs if args.configs else range(len(networkconfig)):
+            run_local(networkconfig[conf], settings, args.local_workers,
+                      args.parameter_servers, args.port)
+    elif args.job_name:
+        conf_num = args.configs[0] if args.configs else 0
+        cluster = cluster_spec(args.worker_hosts.split(','),
+                               args.ps_hosts.split(','))
+        run_task(networkconfig[conf_num], cluster, args.job_name,
+                 args.task_index, settings)
+    elif args.sweep:
+        configs = args.configs if args.configs else range(len(networkconfig))
+        run_sweep([networkconfig[conf] for conf in configs], settings,
+                  args.workers, args.cores_per_worker)
     else:
         for conf in args.configs if args.configs else range(len(networkconfig)):
-            try:
-                print("Starting config ", conf)
-                config_file = networkconfig[conf]
-                with tf.Session() as sess:
-                    builder = ModelBuilder(config_file, sess)
-
-                    network_model = builder.build()
-                    if config_file[USE_PRETRAINED_NET]:
-                        network_model.train(USE_PRETRAINED_NET)
-                    network_model.train()
-                    network_model.close_writers()
-                tf.reset_default_graph()
-            except Exception as e:
-                print("Config ", networkconfig[conf]["name"], "failed to complete", file=sys.stderr)
-                print(e, file=sys.stderr)
-                tf.reset_default_graph()
+            print("Starting config ", conf)
+            train_config(networkconfig[conf], settings)
 
-def serve_application(config=0):
-    """ Serves a simple API for making predictions on a specified model """
+def serve_application(config=0, quantized=False, settings=None):
+    """ Serves a simple API for making predictions on a specified model,
+    from its frozen inference graph if it has been exported, or on its
+    quantized export """
     config_file = networkconfig[config]
-    with tf.Session() as sess:
-        builder = ModelBuilder(config_file, sess)
-        Application(builder.build(), sess)
+    frozen_path = checkpoint_file(config_file, FROZEN_MODEL)
+    settings = settings or session_settings()
+    with tf.Session(config=session_config(settings)) as sess:
+        log_settings(settings)
+        if quantized:
+            builder = ModelBuilder(
+                config_file, sess,
+                quantize.load(checkpoint_file(config_file, QUANTIZED_MODEL)),
+                serving=True)
+            Application(builder.build(), sess)
+        elif os.path.isfile(frozen_path):
+            print("Loading frozen model", frozen_path)
+            serving_data = ServingData.load_or_build(
+                checkpoint_file(config_file, SERVING_DATA), config_file)
+            Application(FrozenModel(config_file, sess, frozen_path,
+                                    serving_data), sess)
+        else:
+            builder = ModelBuilder(config_file, sess, serving=True)
+            Application(builder.build(), sess)
+
+def export_frozen(config=0, settings=None):
+    """ Exports a frozen inference graph of a trained config """
+    # The exported graph is fed directly, not by the input pipeline
+    config_file = dict(networkconfig[config], **{USE_INPUT_PIPELINE: False})
+    settings = settings or session_settings()
+    with tf.Session(config=session_config(settings)) as sess:
+        network_model = ModelBuilder(config_file, sess).build('best')
+        print("Exported", network_model.export_frozen())
+        network_model.close_writers()
+    tf.reset_default_graph()
+
+def checkpoint_file(config_file, name):
+    """ The path of a file saved next to the checkpoints of a config """
+    return os.path.join(build_structure(config_file), CHECKPOINTS_DIR, name)
+
+def export_quantized(config=0, settings=None):
+    """ Exports a quantized model of a trained config and compares its
+    accuracy and latency on the validation data to the float32 model """
+    # The models are fed directly, not by the input pipeline
+    config_file = dict(networkconfig[config], **{USE_INPUT_PIPELINE: False})
+    settings = settings or session_settings()
+    results = {}
+    with tf.Session(config=session_config(settings)) as sess:
+        network_model = ModelBuilder(config_file, sess).build('best')
+        sizes = network_model.export_quantized(
+            config_file.get(QUANTIZED_EMBEDDINGS, 'int8'),
+            config_file.get(QUANTIZED_WEIGHTS, 'float16'))
+        results['float32'] = measure_serving(network_model)
+        path = network_model.quantized_path
+        network_model.close_writers()
+    tf.reset_default_graph()
+    with tf.Session(config=session_config(settings)) as sess:
+        network_model = \
+            ModelBuilder(config_file, sess, quantize.load(path)).build()
+        results['quantized'] = measure_serving(network_model)
+        network_model.close_writers()
+    tf.reset_default_graph()
+    quantize.write_report(sizes, results,
+                          os.path.splitext(path)[0] + '_report.json')
+
+def measure_serving(network_model):
+    """ Measures the accuracy on the validation data and the latency of
+    predicting a single title of a model """
+    precision, recall, f1_score, _ = network_model.evaluate(
+        network_model.data.iter_validation(network_model.eval_batch_size))
+    return {'precision': float(precision),
+            'recall': float(recall),
+            'f1_score': float(f1_score),
+            'latency': network_model.measure_latency()}
 
 if __name__ == "__main__":
     main()
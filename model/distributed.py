@@ -0,0 +1,115 @@
+# MIT License
+#
+# Copyright (c) 2017 Jonatan Almén, Alexander Håkansson, Jesper Jaxing, Gmal
+# Tchaefa, Maxim Goretskyy, Axel Olivecrona
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+"""
+Data parallel training of a config with between-graph replication. The
+variables are kept by parameter server processes, every worker process
+builds the graph, trains on a shard of the training data and updates the
+variables asynchronously. The first worker, the chief, initializes the
+variables, validates and saves the checkpoints.
+"""
+import os
+import sys
+import multiprocessing
+import tensorflow as tf
+from definitions import *
+from .trainer import train_config
+from .sweep import cache_datasets, core_sets
+from .util.session_config import session_config
+
+
+def cluster_spec(worker_hosts, ps_hosts):
+    """ Creates the cluster of lists of host:port addresses, like
+    'localhost:2222' """
+    return tf.train.ClusterSpec({'ps': list(ps_hosts),
+                                 'worker': list(worker_hosts)})
+
+
+def local_cluster(workers, parameter_servers=1, port=2222):
+    """ A cluster of processes on this machine listening on consecutive
+    ports, the parameter servers first """
+    hosts = ['localhost:%d' % (port + task)
+             for task in range(parameter_servers + workers)]
+    return cluster_spec(hosts[parameter_servers:], hosts[:parameter_servers])
+
+
+def run_task(config, cluster, job_name, task_index, settings):
+    """ Runs a task of the cluster in this process. A parameter server
+    serves the variables until the process is killed, a worker trains the
+    config and returns whether it completed """
+    cluster = tf.train.ClusterSpec(cluster)
+    if job_name == 'ps':
+        server = tf.train.Server(cluster, job_name='ps',
+                                 task_index=task_index,
+                                 config=session_config(settings))
+        server.join()
+        return True
+    return train_config(config, settings, cluster, task_index)
+
+
+def _run_worker(config, cluster, task_index, settings):
+    """ Runs a worker task, the process fails if it didn't complete """
+    if not run_task(config, cluster, 'worker', task_index, settings):
+        sys.exit(1)
+
+
+def run_local(config, settings, workers=2, parameter_servers=1, port=2222):
+    """ Trains a config with worker and parameter server processes on this
+    machine. The workers are pinned to their own share of the cores, with
+    as many threads, and the parameter servers are stopped once every
+    worker is done. Returns whether the chief completed """
+    cache_datasets([config])
+    cluster = local_cluster(workers, parameter_servers, port).as_dict()
+    available = settings[CPU_AFFINITY] or sorted(os.sched_getaffinity(0))
+    cores = core_sets(workers, max(1, len(available) // workers), available)
+
+    # Forking a process that has used TensorFlow isn't safe
+    context = multiprocessing.get_context('spawn')
+    servers = [context.Process(target=run_task,
+                               args=(config, cluster, 'ps', task, settings),
+                               daemon=True)
+               for task in range(parameter_servers)]
+    tasks = [context.Process(target=_run_worker,
+                             args=(config, cluster, task, dict(settings, **{
+                                 CPU_AFFINITY: cores[task],
+                                 INTRA_OP_THREADS: len(cores[task]),
+                                 INTER_OP_THREADS:
+                                     settings[INTER_OP_THREADS] or 2})))
+             for task in range(workers)]
+
+    print("Training", config[NET_NAME], "with", workers, "workers of",
+          len(cores[0]), "cores and", parameter_servers,
+          "parameter servers")
+    for process in servers + tasks:
+        process.start()
+    try:
+        for process in tasks:
+            process.join()
+    finally:
+        for process in servers:
+            process.terminate()
+            process.join()
+    completed = sum(process.exitcode == 0 for process in tasks)
+    print(completed, "of", workers, "workers of", config[NET_NAME],
+          "completed")
+    return tasks[0].exitcode == 0
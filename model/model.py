@@ -27,35 +27,59 @@ The model is created as part of the bachelor's thesis
 "Automatic mentions and highlights" at Chalmers University of
 Technology and the University of Gothenburg.
 """
-import glob
+import time
 import os.path
+import collections
 import tensorflow as tf
 from definitions import *
 from .util import data as data
 from .util import helper as helper
+from .util import records as records
+from .util import quantize as quantize
 from .util.folder_builder import build_structure
 from .util.writer import log_samefile
-from .util.helper import get_val_summary_tensor
+from .serving import Predictor, FROZEN_OUTPUTS
 
 
 # TODO Separera checkpoints ut ur modell klassen
-class Model(object):
-    def __init__(self, config, session):
+class Model(Predictor):
+    def __init__(self, config, session, serving=False, cluster=None,
+                 task_index=0):
         self.config = config
         self._session = session
+        # With a cluster, the variables are kept by its parameter servers
+        # and this worker trains on a shard of the training data. Only the
+        # chief validates and saves checkpoints
+        self.cluster = cluster
+        self.task_index = task_index
+        self.is_chief = task_index == 0
+        self.worker_device = "/job:worker/task:%d" % task_index \
+            if cluster is not None else ""
+        # Set by the chief when training is done, never saved
+        self.stop_training = None
+        self.request_stop = None
+        self.uninitialized = None
         self.output_layer = None
         self.latest_layer = None
         self.output_weights = None
         self.output_bias = None
+        # The variables of the network by name, registered by the builder
+        self.weights = collections.OrderedDict()
+        # Names of the weights whose rows are looked up by ID
+        self.lookup_weights = set()
         self.l2_term = tf.constant(0, dtype=tf.float32)
 
         self.vocabulary_size = config[VOC_SIZE]
         self.user_count = config[USER_COUNT]
         self.learning_rate = config[LEARN_RATE]
+        self.optimizer = config.get(OPTIMIZER, 'adam')
+        # Negative users sampled per training step, 0 trains on all users
+        self.sampled_negatives = config.get(SAMPLED_NEGATIVES, 0)
         self.embedding_size = config[EMBEDD_SIZE]
         self.max_title_length = config[MAX_TITLE_LENGTH]
         self.rnn_neurons = config[RNN_NEURONS]
         self.rnn_unit = config[RNN_UNIT]
+        self.rnn_impl = config.get(RNN_IMPL, 'standard')
         self.batch_size = config[BATCH_SIZE]
         self.training_epochs = config[TRAINING_EPOCHS]
         self.use_l2_loss = config[USE_L2_LOSS]
@@ -71,12 +95,29 @@ class Model(object):
         self.constant_prediction_limit = config[CONSTANT_PREDICTION_LIMIT]
         self.use_concat_input = config[USE_CONCAT_INPUT]
         self.use_pretrained_net = config[USE_PRETRAINED_NET]
+        # Only the dictionaries saved when training are read when serving
+        self.serving = serving
+        self._serving_data_saved = False
+        self.use_input_pipeline = config.get(USE_INPUT_PIPELINE, False) \
+            and not serving
+        self.record_shards = config.get(RECORD_SHARDS, 8)
+        self.shuffle_buffer = config.get(SHUFFLE_BUFFER, 10000)
+        # The input pipeline densifies the labels itself, so labels are
+        # only fed as sparse tensors without it
+        self.use_sparse_labels = config.get(SPARSE_LABELS, False) \
+            and not self.use_input_pipeline
+        self.use_subreddit_ids = config.get(USE_SUBREDDIT_IDS, False)
+        self.use_bucketing = config.get(BUCKET_BY_LENGTH, False)
+        self.bucket_width = config.get(BUCKET_WIDTH, 5)
         self.subreddit_count = 0
 
         # Will be set in build_graph
         self.input = None
+        self.sequence_length = None
         self.subreddit_input = None
         self.target = None
+        self.target_input = None
+        self.record_files = None
         self.sec_target = None
         self.sigmoid = None
         self.train_op = None
@@ -88,126 +129,283 @@ class Model(object):
         self.keep_prob = None
         self.embedding_placeholder = None
         self.embedding_init = None
+        # Opened by the first validation, models that are only exported or
+        # served never write TensorBoard logs
         self.train_writer = None
         self.valid_writer = None
         self.predictions = None
-
-        # variables for tensorboard
-        self.prec_sum_training = None
-        self.error_sum = None
-        self.recall_sum_training = None
-        self.f1_sum_training = None
-        self.prec_sum_validation = None
-        self.error_sum = None
-        self.recall_sum_validation = None
-        self.f1_sum_validation = None
+        self.top_k = None
+        self.top_users = None
+        self.top_scores = None
+
+        # Streaming metrics used for evaluation
+        self.evaluation = None
+        # Streaming metrics of the batches trained on since the last epoch
+        self.training_metrics = None
+        # 'accumulate' reports the metrics of the batches trained on,
+        # 'sample' evaluates a fixed sample and 'full' the whole training set
+        self.training_metrics_mode = config.get(TRAINING_METRICS,
+                                                'accumulate')
+        if self.sampled_negatives and \
+                self.training_metrics_mode == 'accumulate':
+            # Accumulating would score all users on every training step
+            self.training_metrics_mode = 'sample'
+        self.training_sample_size = config.get(TRAINING_SAMPLE_SIZE, 10000)
+        self.eval_batch_size = config.get(EVAL_BATCH_SIZE, 1000)
 
         self.logging_dir = build_structure(config)
         self.checkpoints_dir = self.logging_dir + '/' + CHECKPOINTS_DIR + '/' + "models.ckpt"
+        self.frozen_path = self.logging_dir + '/' + CHECKPOINTS_DIR + '/' + FROZEN_MODEL
+        self.quantized_path = self.logging_dir + '/' + CHECKPOINTS_DIR + '/' + QUANTIZED_MODEL
+        self.serving_data_path = self.logging_dir + '/' + CHECKPOINTS_DIR + '/' + SERVING_DATA
 
         self.f1_score_train = 0
         self.f1_score_valid = 0
+
+        # Training stops after this many epochs without the validation F1
+        # score improving by more than the min delta, 0 never stops early
+        self.early_stopping_patience = config.get(EARLY_STOPPING_PATIENCE, 0)
+        self.early_stopping_min_delta = \
+            config.get(EARLY_STOPPING_MIN_DELTA, 0.0)
+        self.epochs_without_improvement = 0
+
+        # Writes versions of checkpoints_dir in the background, set in build
+        self.checkpoint_writer = None
+        self.keep_best_checkpoints = config.get(KEEP_BEST_CHECKPOINTS, 3)
+        self.checkpoint_queue_size = config.get(CHECKPOINT_QUEUE_SIZE, 1)
         self.epoch_top, self.prec_valid, self.prec_train, self.recall_valid, self.recall_train = 0, 0, 0, 0, 0
 
 
 
         with tf.device("/cpu:0"):
-            self.data = data.Data(config)
+            if serving:
+                self.data = data.ServingData.load_or_build(
+                    self.serving_data_path, config)
+                self.vocabulary_size = self.data.vocabulary_size
+            elif config.get(STREAMING):
+                self.data = data.StreamingData(config)
+            else:
+                self.data = data.Data(config)
             self.subreddit_count = self.data.subreddit_count
-            if self.use_pretrained:
+            if self.use_pretrained and not serving:
                 self.vocabulary_size = len(self.data.embedding_matrix)
-
-
-    def load_checkpoint(self):
-        """ Loads any exisiting trained model """
-        checkpoint_files = glob.glob(self.checkpoints_dir + "*")
-        if all([os.path.isfile(file) for file in checkpoint_files]) \
-                and checkpoint_files:
-            self.saver.restore(self._session, self.checkpoints_dir)
+            records_dir = self.logging_dir + '/' + RECORDS_DIR
+            if cluster is not None:
+                worker_count = cluster.num_tasks('worker')
+                self.data.shard_training(task_index, worker_count)
+                # Every worker writes the records of its own shard
+                records_dir += '/worker-%d-of-%d' % (task_index,
+                                                     worker_count)
+            if self.use_input_pipeline:
+                self.record_files = records.write_records(
+                    records_dir, self.data,
+                    os.path.join(DATASETS_PATH, config[TRAINING_DATA]),
+                    self.record_shards)
+
+
+    def load_checkpoint(self, which='latest'):
+        """ Loads any exisiting trained model, the latest checkpoint or the
+        one with the best validation F1 score """
+        path = self.checkpoint_writer.path(which)
+        if path is None and tf.train.checkpoint_exists(self.checkpoints_dir):
+            # Saved before checkpoints were versioned
+            path = self.checkpoints_dir
+        if path is not None:
+            print("Restoring checkpoint", path)
+            self.saver.restore(self._session, path)
             self._session.run(tf.local_variables_initializer())
         else:
             self._session.run(self.init_op)
-
-    def save_checkpoint(self, path=None):
-        """ Saves the model to a file """
-        path = path or self.checkpoints_dir
-        self.saver.save(self._session, path)
-
-    def predict(self, title, subreddit='UNK'):
-        """ Make a prediction based on a title and a subreddit """
-        input_vec, _, _ = helper.get_indicies(title,
-                                              self.data.word_dict,
-                                              self.data.max_title_length)
-        subreddit_vec = helper.label_vector(subreddit,
-                                            self.data.subreddit_dict,
-                                            self.data.subreddit_count)
-        users = self._session.run(self.predictions,
-                                  {self.input: [input_vec],
-                                   self.subreddit_input: [subreddit_vec]})
-        result = []
-        for i, user in enumerate(users[0]):
-            if user:
-                result.append(self.data.rev_users_dict[i])
-        return result
+            if self.use_pretrained and self.cluster is not None:
+                # Before the other workers start training on the embeddings
+                self.init_embeddings()
+        if self.stop_training is not None:
+            # The other workers wait for this to be initialized, last
+            self._session.run(self.stop_training.initializer)
+
+    def init_embeddings(self):
+        """ Assigns the pretrained embeddings to the embedding matrix """
+        self._session.run(self.embedding_init,
+                          feed_dict={self.embedding_placeholder:
+                                     self.data.embedding_matrix})
+
+    def wait_for_chief(self, interval=1.0):
+        """ Waits until the chief has initialized or restored the variables
+        on the parameter servers, then initializes the local variables """
+        while len(self._session.run(self.uninitialized)):
+            print("Waiting for the chief to initialize the variables...")
+            time.sleep(interval)
+        self._session.run(tf.local_variables_initializer())
+
+    def training_stopped(self):
+        """ Whether the chief is done training """
+        return self.stop_training is not None and \
+            self._session.run(self.stop_training)
+
+    def save_checkpoint(self, f1_score=None):
+        """ Saves a new version of the model in the background, versions
+        with an F1 score may be kept as one of the best """
+        epoch = self.epoch.eval(self._session)
+        self.checkpoint_writer.save(self._session, epoch, f1_score)
+        if not self.serving and not self._serving_data_saved:
+            self.save_serving_data()
+
+    def save_serving_data(self):
+        """ Saves what is needed to serve the model without the datasets
+        next to the checkpoints """
+        data.ServingData.save(self.serving_data_path, self.data,
+                              self.vocabulary_size)
+        self._serving_data_saved = True
+
+    def export_frozen(self):
+        """ Writes a frozen inference graph next to the checkpoints, which
+        only holds the operations the predictions depend on and the
+        variables as constants """
+        self.save_serving_data()
+        graph_def = tf.graph_util.convert_variables_to_constants(
+            self._session, self._session.graph.as_graph_def(),
+            FROZEN_OUTPUTS)
+        with open(self.frozen_path, 'wb') as target:
+            target.write(graph_def.SerializeToString())
+        return self.frozen_path
+
+    def export_quantized(self, embedding_dtype='int8',
+                         weight_dtype='float16'):
+        """ Writes the quantized weights of the model next to the
+        checkpoints, returns the sizes of the weights before and after """
+        self.save_serving_data()
+        return quantize.export(self._session, self.weights,
+                               self.lookup_weights, self.quantized_path,
+                               embedding_dtype, weight_dtype)
+
+    def measure_latency(self, count=200):
+        """ Returns the mean time in seconds it takes to predict the users
+        of a single validation title, over count titles sampled uniformly
+        so the lengths are representative even when the validation set is
+        sorted by length """
+        elapsed, runs = 0.0, 0
+        for batch_input, batch_len, batch_sub, _ in \
+                self.data.iter_validation_sample(count, 1):
+            feed_dict = self._titles(batch_input, batch_len)
+            feed_dict[self.subreddit_input] = self._subreddits(batch_sub)
+            start = time.perf_counter()
+            self._session.run(self.predictions, feed_dict)
+            elapsed += time.perf_counter() - start
+            runs += 1
+        return elapsed / max(runs, 1)
+
+    def _labels(self, labels):
+        """ Converts a LabelMatrix to the form target_input is fed with """
+        if self.use_sparse_labels:
+            return tf.SparseTensorValue(*labels.to_sparse())
+        return labels.to_dense()
+
+    def evaluate(self, batches):
+        """ Evaluates the model over batches of data, accumulating the
+        metrics so only one batch is in memory at a time. Returns the
+        precision, recall, F1 score and cross entropy """
+        metrics = self.evaluation
+        self._session.run(metrics.reset)
+        for batch_input, batch_len, batch_sub, batch_label in batches:
+            feed_dict = self._titles(batch_input, batch_len)
+            feed_dict.update({self.subreddit_input:
+                                  self._subreddits(batch_sub),
+                              self.target_input: self._labels(batch_label),
+                              self.keep_prob: 1.0})
+            self._session.run(metrics.update, feed_dict)
+        return self._session.run([metrics.precision,
+                                  metrics.recall,
+                                  metrics.f1_score,
+                                  metrics.error])
+
+    def evaluate_training(self):
+        """ Returns the precision, recall, F1 score and cross entropy of the
+        training data since the last call, depending on the training metrics
+        mode """
+        if self.training_metrics_mode == 'accumulate':
+            metrics = self.training_metrics
+            results = self._session.run([metrics.precision,
+                                         metrics.recall,
+                                         metrics.f1_score,
+                                         metrics.error])
+            self._session.run(metrics.reset)
+            return results
+        if self.training_metrics_mode == 'sample':
+            return self.evaluate(self.data.iter_training_sample(
+                self.training_sample_size, self.eval_batch_size))
+        return self.evaluate(self.data.iter_training(self.eval_batch_size))
+
+    def write_summaries(self, writer, epoch, split, precision, recall,
+                        f1_score, error):
+        """ Writes the results of an evaluation to TensorBoard """
+        for tag, value in [('precision_' + split, precision),
+                           ('cross_entropy', error),
+                           ('recall_' + split, recall),
+                           ('f1_score_' + split, f1_score)]:
+            writer.add_summary(tf.summary.Summary(value=[
+                tf.summary.Summary.Value(tag=tag, simple_value=value)]),
+                epoch)
+
+    def open_writers(self):
+        """ Opens the TensorBoard writers, unless they are open """
+        if self.train_writer is None:
+            self.train_writer = \
+                tf.summary.FileWriter(self.logging_dir + '/' + TENSOR_DIR_TRAIN,
+                                      self._session.graph)
+            self.valid_writer = \
+                tf.summary.FileWriter(self.logging_dir + '/' + TENSOR_DIR_VALID)
 
     def validate(self):
-        """ Validates the model and returns the final precision """
+        """ Validates the model and returns the validation F1 score """
         print("Starting validation...")
+        self.open_writers()
         # Evaluate epoch
         epoch = self.epoch.eval(self._session)
 
         # Compute validation error
-        val_data, val_sub, val_labels = self.data.get_validation()
-        val_prec, val_err, val_recall, val_f1 = \
-            self._session.run([self.prec_sum_validation,
-                               self.error_sum,
-                               self.recall_sum_validation,
-                               self.f1_sum_validation],
-                              {self.input: val_data,
-                               self.subreddit_input: val_sub,
-                               self.target: val_labels,
-                               self.keep_prob: 1.0})
+        val_prec, val_recall, val_f1, val_err = \
+            self.evaluate(self.data.iter_validation(self.eval_batch_size))
 
         # Write results to TensorBoard
-        self.valid_writer.add_summary(val_prec, epoch)
-        self.valid_writer.add_summary(val_err, epoch)
-        self.valid_writer.add_summary(val_recall, epoch)
-        self.valid_writer.add_summary(val_f1, epoch)
+        self.write_summaries(self.valid_writer, epoch, 'validation',
+                             val_prec, val_recall, val_f1, val_err)
 
         # Compute training error
-        train_data, train_sub, train_labels = self.data.get_training()
-        train_prec, train_err, train_recall, train_f1 = \
-            self._session.run([self.prec_sum_training,
-                               self.error_sum,
-                               self.recall_sum_training,
-                               self.f1_sum_training],
-                              {self.input: train_data,
-                               self.subreddit_input: train_sub,
-                               self.target: train_labels,
-                               self.keep_prob: 1.0})
+        train_prec, train_recall, train_f1, train_err = \
+            self.evaluate_training()
+
         # Write results to Tensorboard
-        self.train_writer.add_summary(train_prec, epoch)
-        self.train_writer.add_summary(train_err, epoch)
-        self.train_writer.add_summary(train_recall, epoch)
-        self.train_writer.add_summary(train_f1, epoch)
-
-        if self.f1_score_valid < get_val_summary_tensor(val_f1):
-            self.f1_score_valid = get_val_summary_tensor(val_f1)
-            self.f1_score_train = get_val_summary_tensor(train_f1)
+        self.write_summaries(self.train_writer, epoch, 'training',
+                             train_prec, train_recall, train_f1, train_err)
+
+        if val_f1 > self.f1_score_valid + self.early_stopping_min_delta:
+            self.epochs_without_improvement = 0
+        else:
+            self.epochs_without_improvement += 1
+
+        if self.f1_score_valid < val_f1:
+            self.f1_score_valid = val_f1
+            self.f1_score_train = train_f1
             self.epoch_top, self.prec_valid, self.prec_train, self.recall_valid, self.recall_train = \
-                epoch, get_val_summary_tensor(val_prec), get_val_summary_tensor(train_prec), \
-                get_val_summary_tensor(val_recall), get_val_summary_tensor(train_recall)
+                epoch, val_prec, train_prec, val_recall, train_recall
+        return val_f1
+
+    def stop_early(self):
+        """ Whether the validation F1 score has stopped improving """
+        return self.early_stopping_patience and \
+            self.epochs_without_improvement >= self.early_stopping_patience
 
     # Currently not used. Saving for now. Might come in handy later
     def validate_batch(self):
         """ Validates a batch of data and returns cross entropy error """
         with tf.device("/cpu:0"):
-            batch_input, batch_sub, batch_label = self.data.next_valid_batch()
+            batch_input, batch_len, batch_sub, batch_label = \
+                self.data.next_valid_batch()
 
-        return self._session.run(self.error,
-                                 feed_dict={self.input: batch_input,
-                                            self.subreddit_input: batch_sub,
-                                            self.target: batch_label})
+        feed_dict = self._titles(batch_input, batch_len)
+        feed_dict.update({self.subreddit_input: self._subreddits(batch_sub),
+                          self.target_input: self._labels(batch_label)})
+        return self._session.run(self.error, feed_dict=feed_dict)
 
     def train(self, use_pretrained_net=False):
         """ Trains the model on the dataset """
@@ -216,14 +414,14 @@ class Model(object):
         else:
             print("Starting training...")
 
-        if self.use_pretrained:
-            self._session.run(self.embedding_init,
-                              feed_dict={self.embedding_placeholder:
-                                         self.data.embedding_matrix})
+        # When distributed, the chief assigns them when initializing
+        if self.use_pretrained and self.cluster is None:
+            self.init_embeddings()
 
         old_epoch = 0
 
-        if self.epoch.eval(self._session) == 0 and not use_pretrained_net:
+        if self.epoch.eval(self._session) == 0 and not use_pretrained_net \
+                and self.is_chief:
             self.validate()
 
         itr_for_n_epochs = \
@@ -248,22 +446,47 @@ class Model(object):
                 self.train_batch()
 
                 # Don't print so often
-                if i % (self.data.train_size // self.batch_size // 10) == 0 and i:
+                if i % max(self.data.train_size // self.batch_size // 10, 1) == 0 and i:
                     done = self.data.percent_of_epoch
                     print("Epoch comletion: {:.0%}".format(done))
             else:
                 self.train_batch(True)
 
+            # Other workers only train until the chief is done
+            if epoch != old_epoch and not use_pretrained_net \
+                    and not self.is_chief and self.training_stopped():
+                print("The chief is done training, stopping")
+                break
+
             # Do a full evaluation once an epoch is complete
-            if epoch != old_epoch and not use_pretrained_net:
+            if epoch != old_epoch and not use_pretrained_net \
+                    and self.is_chief:
                 self._session.run(self.epoch.assign_add(1))
                 print("Epoch complete...old ", old_epoch)
-                self.save_checkpoint()
-                self.validate()
+                self.save_checkpoint(self.validate())
+                if self.stop_early():
+                    print("No improvement for", self.epochs_without_improvement,
+                          "epochs, stopping early")
+                    break
             old_epoch = epoch
 
+        if not self.is_chief:
+            return
+        if not use_pretrained_net and self.request_stop is not None:
+            # Other workers stop at the end of their epoch. The best
+            # checkpoint isn't restored as they may still update the
+            # variables until then
+            self._session.run(self.request_stop)
+        elif not use_pretrained_net and self.early_stopping_patience:
+            # Continue from the epoch with the best validation F1 score,
+            # if one was saved, rather than from initialized weights
+            self.checkpoint_writer.wait()
+            if self.checkpoint_writer.path('best') is not None:
+                self.load_checkpoint('best')
+
         # Save model when done training
         self.save_checkpoint()
+        self.checkpoint_writer.wait()
         if not use_pretrained_net:
             log_samefile(config=self.config, f1_score_valid=self.f1_score_valid, f1_score_train=self.f1_score_train,
                          epoch_top=self.epoch_top, prec_valid=self.prec_valid, prec_train=self.prec_train,
@@ -271,32 +494,52 @@ class Model(object):
 
     def train_batch(self, pre_train_net=False):
         """ Trains for one batch and returns cross entropy error """
+        if self.use_input_pipeline and not pre_train_net:
+            # The batch is read by the input pipeline in the graph
+            self.data.skip_train_batch()
+            self._session.run(self._train_ops(),
+                              {self.keep_prob: self.dropout_prob})
+            return
+
         with tf.device("/cpu:0"):
             if not pre_train_net:
-                batch_input, batch_sub, batch_label = \
+                batch_input, batch_len, batch_sub, batch_label = \
                     self.data.next_train_batch()
             else:
-                batch_input, batch_sub, batch_label = \
+                batch_input, batch_len, batch_sub, batch_label = \
                     self.data.next_pre_train_batch()
 
+        feed_dict = self._titles(batch_input, batch_len)
+        feed_dict[self.keep_prob] = self.dropout_prob
         if pre_train_net and self.use_concat_input:
-            self._session.run(self.pre_train_op,
-                              {self.input: batch_input,
-                               self.subreddit_input: batch_sub,
-                               self.sec_target: batch_label})
+            feed_dict.update({self.subreddit_input:
+                                  self._subreddits(batch_sub),
+                              self.sec_target:
+                                  helper.one_hot(batch_label,
+                                                 self.subreddit_count)})
+            self._session.run(self.pre_train_op, feed_dict)
         elif pre_train_net:
-            self._session.run(self.pre_train_op,
-                              {self.input: batch_input,
-                               self.sec_target: batch_label})
+            feed_dict[self.sec_target] = \
+                helper.one_hot(batch_label, self.subreddit_count)
+            self._session.run(self.pre_train_op, feed_dict)
         else:
-            self._session.run(self.train_op,
-                              {self.input: batch_input,
-                               self.subreddit_input: batch_sub,
-                               self.target: batch_label})
+            feed_dict.update({self.subreddit_input:
+                                  self._subreddits(batch_sub),
+                              self.target_input: self._labels(batch_label)})
+            self._session.run(self._train_ops(), feed_dict)
+
+    def _train_ops(self):
+        """ The operations run for a training batch. Accumulated training
+        metrics share the forward pass of the train op """
+        if self.training_metrics_mode == 'accumulate':
+            return [self.train_op, self.training_metrics.update]
+        return self.train_op
 
     def close_writers(self):
-        """ Close tensorboard writers """
-        self.train_writer.close()
-        self.valid_writer.close()
+        """ Close tensorboard and checkpoint writers """
+        self.checkpoint_writer.close()
+        if self.train_writer is not None:
+            self.train_writer.close()
+            self.valid_writer.close()
 
 
@@ -22,17 +22,96 @@
 # SOFTWARE.
 # ==============================================================================
 
+import collections
 import tensorflow as tf
 from model.model import Model
+from model.util import records
+from model.util import quantize
+from model.util.checkpoints import CheckpointWriter
 from definitions import *
 
+# Values, update and reset operations of metrics accumulated over batches
+StreamingMetrics = collections.namedtuple(
+    'StreamingMetrics',
+    ['precision', 'recall', 'f1_score', 'error', 'update', 'reset'])
+
 class ModelBuilder(object):
     """A class following the builder pattern to create a model"""
 
-    def __init__(self, config, session):
-        self._model = Model(config, session)
+    def __init__(self, config, session, quantized=None, serving=False,
+                 cluster=None, task_index=0, session_config=None):
+        self._model = Model(config, session, serving, cluster, task_index)
+        # The ConfigProto of the session, also used to write checkpoints
+        self._session_config = session_config
         self.added_layers = False
         self.number_of_layers = 0
+        # Weights loaded with quantize.load, the model is built for serving
+        # these instead of training when given
+        self._quantized = quantized
+        self._quantized_feed = {}
+        self._quantized_rows = {}
+
+    def _weight(self, initial_value, name, trainable=True, lookup=False):
+        """Creates a variable of the network weights, which is registered in
+        the model so it can be exported. When serving quantized weights
+        they are read from those instead. Rows of weights created with
+        lookup are looked up with _embedding_lookup"""
+        if self._quantized is not None:
+            # tf.Variable would be given the same unique name
+            name = tf.get_default_graph().unique_name(name, mark_as_used=False)
+            return self._quantized_weight(name, lookup=lookup)
+        variable = tf.Variable(initial_value, trainable=trainable, name=name,
+                               dtype=tf.float32)
+        self._model.weights[variable.op.name] = variable
+        if lookup:
+            self._model.lookup_weights.add(variable.op.name)
+        return variable
+
+    def _weight_getter(self, getter, name, *args, **kwargs):
+        """A custom getter doing what _weight does for the variables created
+        with tf.get_variable, like the ones of the RNN cells"""
+        if self._quantized is not None:
+            return self._quantized_weight(name, getter)
+        variable = getter(name, *args, **kwargs)
+        self._model.weights[name] = variable
+        return variable
+
+    def _quantized_weight(self, name, getter=None, lookup=False):
+        """Creates variables of the quantized values of a weight, fed once
+        when initialized, and returns them converted to float32"""
+        def variable(variable_name, value):
+            placeholder = tf.placeholder(value.dtype, value.shape)
+            self._quantized_feed[placeholder] = value
+            if getter is None:
+                return tf.Variable(placeholder, trainable=False,
+                                   name=variable_name)
+            return getter(variable_name, dtype=placeholder.dtype,
+                          initializer=placeholder, trainable=False)
+
+        values, scale = self._quantized[name]
+        values = variable(name, values)
+        if scale is not None:
+            scale = variable(name + '_scale', scale)
+        weight = quantize.dequantize(values, scale)
+        if lookup:
+            self._quantized_rows[weight.name] = values, scale
+        return weight
+
+    def _embedding_lookup(self, weight, ids):
+        """Looks up rows of a weight, only the rows looked up are converted
+        to float32 when serving quantized weights"""
+        if weight.name in self._quantized_rows:
+            return quantize.embedding_lookup(
+                *self._quantized_rows[weight.name], ids)
+        return tf.nn.embedding_lookup(weight, ids)
+
+    @staticmethod
+    def _input_placeholder(default, dtype, shape, name):
+        """Creates a placeholder, which defaults to the given tensor if it
+        is not None"""
+        if default is None:
+            return tf.placeholder(dtype, shape, name=name)
+        return tf.placeholder_with_default(default, shape, name=name)
 
     def add_input_layer(self):
         """
@@ -41,79 +120,182 @@ class ModelBuilder(object):
         """
         self._model.epoch = tf.Variable(0, dtype=tf.int32, name="train_epoch")
 
-        self._model.input = \
-            tf.placeholder(tf.int32,
-                           [None, self._model.max_title_length],
-                           name="input")
-        self._model.subreddit_input = \
-            tf.placeholder(tf.float32,
-                           [None, self._model.subreddit_count],
-                           name="subreddit_input")
-        self._model.target = \
-            tf.placeholder(tf.float32,
-                           [None, self._model.user_count],
-                           name="target")
+        if self._model.use_input_pipeline:
+            # Batches are read by the pipeline unless they are fed
+            with tf.device("/cpu:0"):
+                dataset = records.make_dataset(
+                    self._model.record_files,
+                    self._model.max_title_length,
+                    self._model.user_count,
+                    self._model.subreddit_count,
+                    self._model.batch_size,
+                    self._model.use_subreddit_ids,
+                    self._model.shuffle_buffer,
+                    bucket_width=self._model.bucket_width
+                    if self._model.use_bucketing else None)
+                next_input, next_length, next_subreddit, next_target = \
+                    dataset.make_one_shot_iterator().get_next()
+        else:
+            next_input, next_length, next_subreddit, next_target = \
+                None, None, None, None
+
+        if self._model.use_bucketing:
+            # Right padded titles, trimmed to the longest title of a batch
+            self._model.input = \
+                self._input_placeholder(next_input, tf.int32, [None, None],
+                                        name="input")
+            self._model.sequence_length = \
+                self._input_placeholder(next_length, tf.int32, [None],
+                                        name="sequence_length")
+        else:
+            self._model.input = \
+                self._input_placeholder(next_input, tf.int32,
+                                        [None, self._model.max_title_length],
+                                        name="input")
+        if self._model.use_subreddit_ids:
+            # One subreddit ID per example
+            self._model.subreddit_input = \
+                self._input_placeholder(next_subreddit, tf.int32, [None],
+                                        name="subreddit_input")
+        else:
+            self._model.subreddit_input = \
+                self._input_placeholder(next_subreddit, tf.float32,
+                                        [None, self._model.subreddit_count],
+                                        name="subreddit_input")
+        if self._model.use_sparse_labels:
+            # Labels are fed as a sparse tensor and densified per batch
+            self._model.target_input = \
+                tf.sparse_placeholder(tf.float32,
+                                      [None, self._model.user_count],
+                                      name="target")
+            self._model.target = \
+                tf.sparse_tensor_to_dense(self._model.target_input)
+            self._model.target.set_shape([None, self._model.user_count])
+        else:
+            self._model.target = \
+                self._input_placeholder(next_target, tf.float32,
+                                        [None, self._model.user_count],
+                                        name="target")
+            self._model.target_input = self._model.target
         self._model.sec_target = \
             tf.placeholder(tf.float32,
                            [None, self._model.data.subreddit_count],
                            name="sec_target")
 
-        self._model.keep_prob = tf.placeholder(tf.float32, name="keep_prob")
-
-        if self._model.rnn_unit == 'lstm':
-            rnn_layer = tf.contrib.rnn.LSTMCell(self._model.rnn_neurons)
-        elif self._model.rnn_unit == 'gru':
-            rnn_layer = tf.contrib.rnn.GRUCell(self._model.rnn_neurons)
-        else:
-            print("Incorrect RNN unit, defaulting to LSTM")
-            rnn_layer = tf.contrib.rnn.LSTMCell(self._model.rnn_neurons)
+        # Only dropped out when training
+        self._model.keep_prob = \
+            tf.placeholder_with_default(1.0, [], name="keep_prob")
 
         # Embedding matrix for the words
-        embedding_matrix = tf.Variable(
+        embedding_matrix = self._weight(
             tf.random_uniform(
                 [self._model.vocabulary_size,
                  self._model.embedding_size],
                 -1.0, 1.0, dtype=tf.float32),
             trainable=self._model.is_trainable_matrix,
             name="embedding_matrix",
-            dtype=tf.float32)
+            lookup=True)
 
-        self._model.embedding_placeholder = \
-            tf.placeholder(tf.float32,
-                           [self._model.vocabulary_size, self._model.embedding_size])
-        self._model.embedding_init = \
-            embedding_matrix.assign(self._model.embedding_placeholder)
+        if self._quantized is None:
+            self._model.embedding_placeholder = \
+                tf.placeholder(tf.float32,
+                               [self._model.vocabulary_size, self._model.embedding_size])
+            self._model.embedding_init = \
+                embedding_matrix.assign(self._model.embedding_placeholder)
 
-        embedded_input = tf.nn.embedding_lookup(embedding_matrix,
+        embedded_input = self._embedding_lookup(embedding_matrix,
                                                 self._model.input)
-        # Run the LSTM layer with the embedded input
-        outputs, _ = tf.nn.dynamic_rnn(rnn_layer, embedded_input,
-                                       dtype=tf.float32)
-
-        outputs = tf.transpose(outputs, [1, 0, 2])
-        output = outputs[-1]
+        # Run the RNN layer with the embedded input
+        with tf.variable_scope(tf.get_variable_scope(),
+                               custom_getter=self._weight_getter):
+            if self._model.rnn_impl == 'fused':
+                output = self._add_fused_rnn(embedded_input)
+            else:
+                output = self._add_rnn(embedded_input)
         if self._model.use_concat_input:
             # Add subreddit to end of input
-            subreddit_weights = tf.Variable(tf.random_normal(
+            subreddit_weights = self._weight(tf.random_normal(
                     [self._model.subreddit_count,
                      self._model.subreddit_input_neurons],
                     stddev=0.35,
                     dtype=tf.float32),
-                name="sub_input_weights")
+                name="sub_input_weights",
+                lookup=self._model.use_subreddit_ids)
 
-            subreddit_bias = tf.Variable(tf.random_normal(
+            subreddit_bias = self._weight(tf.random_normal(
                     [self._model.subreddit_input_neurons],
                     stddev=0.35,
                     dtype=tf.float32),
                 name="sub_input_bias")
 
-            logit_subreddit = tf.add(
-                tf.matmul(self._model.subreddit_input, subreddit_weights),
-                subreddit_bias)
+            if self._model.use_subreddit_ids:
+                # Same as multiplying a one-hot vector with the weights
+                subreddit_input = self._embedding_lookup(
+                    subreddit_weights, self._model.subreddit_input)
+            else:
+                subreddit_input = tf.matmul(self._model.subreddit_input,
+                                            subreddit_weights)
+            logit_subreddit = tf.add(subreddit_input, subreddit_bias)
             output = tf.concat([output, logit_subreddit], 1)
 
         self._model.latest_layer = output
 
+    def _rnn_unit(self):
+        """ Returns the configured RNN unit, 'lstm' or 'gru' """
+        if self._model.rnn_unit not in ('lstm', 'gru'):
+            print("Incorrect RNN unit, defaulting to LSTM")
+            return 'lstm'
+        return self._model.rnn_unit
+
+    def _add_rnn(self, embedded_input):
+        """ Unrolls an LSTMCell or GRUCell over the embedded titles with
+        dynamic_rnn and returns the output after the last word """
+        if self._rnn_unit() == 'lstm':
+            rnn_layer = tf.contrib.rnn.LSTMCell(self._model.rnn_neurons)
+        else:
+            rnn_layer = tf.contrib.rnn.GRUCell(self._model.rnn_neurons)
+
+        outputs, _ = tf.nn.dynamic_rnn(
+            rnn_layer, embedded_input,
+            sequence_length=self._model.sequence_length,
+            dtype=tf.float32)
+
+        if self._model.use_bucketing:
+            # The output of the last word of every title, the padding after
+            # it is skipped by dynamic_rnn
+            last_word = tf.stack([tf.range(tf.shape(outputs)[0]),
+                                  self._model.sequence_length - 1], axis=1)
+            return tf.gather_nd(outputs, last_word)
+        outputs = tf.transpose(outputs, [1, 0, 2])
+        return outputs[-1]
+
+    def _add_fused_rnn(self, embedded_input):
+        """
+        Runs the block implementation of the RNN unit time major over the
+        embedded titles and returns the output after the last word. The
+        variables are named like the ones of _add_rnn, but restoring
+        checkpoints across the implementations isn't supported
+        """
+        time_major_input = tf.transpose(embedded_input, [1, 0, 2])
+        if self._rnn_unit() == 'lstm':
+            # A single op for the whole sequence
+            with tf.variable_scope("rnn"):
+                rnn_layer = tf.contrib.rnn.LSTMBlockFusedCell(
+                    self._model.rnn_neurons, name="lstm_cell")
+                _, state = rnn_layer(
+                    time_major_input, dtype=tf.float32,
+                    sequence_length=self._model.sequence_length)
+            return state.h
+        # A single op per time step
+        rnn_layer = tf.contrib.rnn.GRUBlockCellV2(self._model.rnn_neurons,
+                                                  name="gru_cell")
+        _, state = tf.nn.dynamic_rnn(
+            rnn_layer, time_major_input,
+            sequence_length=self._model.sequence_length,
+            dtype=tf.float32, time_major=True)
+        # The state of a GRU is its output after the last word
+        return state
+
     def add_layer(self, number_of_neurons):
         """Adds a layer between latest added layer and the output layer"""
 
@@ -121,7 +303,7 @@ class ModelBuilder(object):
 
         if not self.added_layers:
             self.added_layers = True
-            weights = tf.Variable(tf.random_normal(
+            weights = self._weight(tf.random_normal(
                 [self._model.rnn_neurons +
                  (self._model.subreddit_input_neurons
                   if self._model.use_concat_input
@@ -130,18 +312,18 @@ class ModelBuilder(object):
                 stddev=0.35,
                 dtype=tf.float32),
                                   name="weights" + str(self.number_of_layers))
-            bias = tf.Variable(tf.random_normal([number_of_neurons],
+            bias = self._weight(tf.random_normal([number_of_neurons],
                                                 stddev=0.35,
                                                 dtype=tf.float32),
                                name="biases" + str(self.number_of_layers))
 
         else:
-            weights = tf.Variable(tf.random_normal(
+            weights = self._weight(tf.random_normal(
                 [self._model.latest_layer.get_shape()[1].value, number_of_neurons],
                 stddev=0.35,
                 dtype=tf.float32),
                                   name="weights" + str(self.number_of_layers))
-            bias = tf.Variable(tf.random_normal([number_of_neurons],
+            bias = self._weight(tf.random_normal([number_of_neurons],
                                                 stddev=0.35,
                                                 dtype=tf.float32),
                                name="biases" + str(self.number_of_layers))
@@ -155,7 +337,7 @@ class ModelBuilder(object):
         if self._model.use_dropout:
             self._model.latest_layer = \
                 tf.nn.dropout(self._model.latest_layer,
-                              self._model.dropout_prob,
+                              self._model.keep_prob,
                               name="hidden_layer" + str(self.number_of_layers) + "dropout")
 
         return self
@@ -166,18 +348,31 @@ class ModelBuilder(object):
 
         # Output layer
         # Feed the output of the previous layer to a sigmoid layer
-        sigmoid_weights = tf.Variable(tf.random_normal(
-            [self._model.latest_layer.get_shape()[1].value, output_size],
-            stddev=0.35,
-            dtype=tf.float32),
-                                      name="output_weights")
+        input_size = self._model.latest_layer.get_shape()[1].value
+        sampled = self._model.sampled_negatives and not secondary_output
+        if sampled:
+            # One row per user, so the rows of sampled users can be
+            # gathered and updated sparsely
+            sigmoid_weights = self._weight(tf.random_normal(
+                [output_size, input_size],
+                stddev=0.35,
+                dtype=tf.float32),
+                                          name="output_weights")
+        else:
+            sigmoid_weights = self._weight(tf.random_normal(
+                [input_size, output_size],
+                stddev=0.35,
+                dtype=tf.float32),
+                                          name="output_weights")
 
-        sigmoid_bias = tf.Variable(tf.random_normal([output_size],
+        sigmoid_bias = self._weight(tf.random_normal([output_size],
                                                     stddev=0.35,
                                                     dtype=tf.float32),
                                    name="output_biases")
 
-        logits = tf.add(tf.matmul(self._model.latest_layer, sigmoid_weights), sigmoid_bias)
+        logits = tf.add(tf.matmul(self._model.latest_layer, sigmoid_weights,
+                                  transpose_b=bool(sampled)),
+                        sigmoid_bias)
 
         if secondary_output:
             error = tf.nn.softmax_cross_entropy_with_logits(
@@ -205,105 +400,163 @@ class ModelBuilder(object):
         else:
             cross_entropy = tf.reduce_mean(error)
 
+        if not secondary_output:
+            self._model.error = cross_entropy
+            self._model.output_weights = sigmoid_weights
+            self._model.output_bias = sigmoid_bias
+
+        if self._quantized is not None:
+            # Quantized weights are only served, not trained
+            return self
+
+        if sampled:
+            # Evaluation and serving still score all users
+            cross_entropy = self._sampled_loss(sigmoid_weights, sigmoid_bias)
+
         if secondary_output:
-            self._model.pre_train_op = tf.train.AdamOptimizer(
-                self._model.learning_rate).minimize(cross_entropy)
+            self._model.pre_train_op = \
+                self._optimizer().minimize(cross_entropy)
         else:
-            self._model.error = cross_entropy
-            self._model.train_op = tf.train.AdamOptimizer(
-                self._model.learning_rate).minimize(cross_entropy)
+            self._model.train_op = self._optimizer().minimize(cross_entropy)
 
         return self
 
+    def _sampled_loss(self, weights, bias):
+        """Creates the training loss of the users of a batch with a positive
+        label and uniformly sampled negative users, so the cost of a step
+        doesn't grow with the number of users"""
+        if self._model.use_sparse_labels:
+            label_indices = self._model.target_input.indices
+            label_values = self._model.target_input.values
+        else:
+            label_indices = tf.where(tf.greater(self._model.target, 0))
+            label_values = tf.gather_nd(self._model.target, label_indices)
+        negatives = tf.random_uniform([self._model.sampled_negatives],
+                                      maxval=self._model.user_count,
+                                      dtype=tf.int64)
+        # The users scored and the column of every label among them
+        candidates, columns = \
+            tf.unique(tf.concat([label_indices[:, 1], negatives], 0),
+                      out_idx=tf.int64)
+        label_count = tf.shape(label_indices)[0]
+        labels = tf.scatter_nd(
+            tf.stack([label_indices[:, 0], columns[:label_count]], 1),
+            label_values,
+            tf.stack([tf.shape(self._model.latest_layer,
+                               out_type=tf.int64)[0],
+                      tf.size(candidates, out_type=tf.int64)]))
+
+        sampled_weights = tf.gather(weights, candidates)
+        sampled_bias = tf.gather(bias, candidates)
+        logits = tf.add(tf.matmul(self._model.latest_layer, sampled_weights,
+                                  transpose_b=True),
+                        sampled_bias)
+        error = tf.nn.sigmoid_cross_entropy_with_logits(labels=labels,
+                                                        logits=logits)
+        if self._model.use_l2_loss:
+            return tf.reduce_mean(tf.add(
+                tf.add(error,
+                       tf.multiply(self._model.l2_factor,
+                                   tf.nn.l2_loss(sampled_weights))),
+                tf.add(tf.multiply(self._model.l2_factor,
+                                   tf.nn.l2_loss(sampled_bias)),
+                       tf.multiply(self._model.l2_factor,
+                                   self._model.l2_term))))
+        return tf.reduce_mean(error)
+
+    def _optimizer(self):
+        """Creates the optimizer of the config. The gradients of looked up
+        rows are sparse, 'lazy_adam' and 'adagrad' only update the moments
+        of those rows while 'adam' updates every row of a trainable
+        embedding matrix on every step"""
+        if self._model.optimizer == 'lazy_adam':
+            return tf.contrib.opt.LazyAdamOptimizer(self._model.learning_rate)
+        if self._model.optimizer == 'adagrad':
+            return tf.train.AdagradOptimizer(self._model.learning_rate)
+        if self._model.optimizer == 'adam':
+            return tf.train.AdamOptimizer(self._model.learning_rate)
+        raise ValueError("Unknown optimizer: " + self._model.optimizer)
+
     def add_precision_operations(self):
-        """Adds precision operation and tensorboard operations"""
-        # Determine which prediction function to use. Casts a tensor to
-        # booleans.
+        """Adds prediction and evaluation operations"""
+        # Determine which limit to use, broadcast over every row
         if self._model.use_constant_limit:
             # x above limit are True, else False
-            prediction_func = lambda x: tf.greater_equal(
-                x, self._model.constant_prediction_limit)
+            limit = self._model.constant_prediction_limit
         else:
-            # x above mean are True, else False
-            prediction_func = lambda x: tf.greater_equal(
-                x, tf.reduce_mean(x))
+            # x above the mean of its row are True, else False
+            limit = tf.reduce_mean(self._model.sigmoid, axis=1,
+                                   keepdims=True)
 
         # Convert all probibalistic predictions to discrete predictions
         self._model.predictions = \
-            tf.map_fn(prediction_func, self._model.sigmoid, dtype=tf.bool)
-
-        # Calculate precision
-        # Need to create two different precisions, because they have
-        # internal memory of old values
-        _, self._model.precision_validation = \
-            tf.metrics.precision(self._model.target,
-                                 self._model.predictions)
-        _, self._model.precision_training = \
-            tf.metrics.precision(self._model.target,
-                                 self._model.predictions)
-        # Calculate recall
-        _, self._model.recall_validation = \
-            tf.metrics.recall(self._model.target,
-                              self._model.predictions)
-        _, self._model.recall_training = \
-            tf.metrics.recall(self._model.target,
-                              self._model.predictions)
-
-        # Calculate F1-score: 2 * (prec * recall) / (prec + recall)
-        self._model.f1_score_validation = \
-            tf.multiply(2.0,
-                        tf.truediv(tf.multiply(self._model.precision_validation,
-                                               self._model.recall_validation),
-                                   tf.add(self._model.precision_validation,
-                                          self._model.recall_validation)))
-        # Convert to 0 if f1 score is NaN
-        self._model.f1_score_validation = \
-            tf.where(tf.is_nan(self._model.f1_score_validation),
-                     tf.zeros_like(self._model.f1_score_validation),
-                     self._model.f1_score_validation)
-
-        self._model.f1_score_training = \
-            tf.multiply(2.0,
-                        tf.truediv(tf.multiply(self._model.precision_training,
-                                               self._model.recall_training),
-                                   tf.add(self._model.precision_training,
-                                          self._model.recall_training)))
-        # Convert to 0 if f1 score is NaN
-        self._model.f1_score_training = \
-            tf.where(tf.is_nan(self._model.f1_score_training),
-                     tf.zeros_like(self._model.f1_score_training),
-                     self._model.f1_score_training)
-
-        self._model.error_sum = \
-            tf.summary.scalar('cross_entropy', self._model.error)
-
-        # Need to create two different, because they have internal memory
-        # of old values
-        self._model.prec_sum_validation = \
-            tf.summary.scalar('precision_validation',
-                              self._model.precision_validation)
-        self._model.prec_sum_training = \
-            tf.summary.scalar('precision_training',
-                              self._model.precision_training)
-
-        self._model.recall_sum_validation = \
-            tf.summary.scalar('recall_validation',
-                              self._model.recall_validation)
-        self._model.recall_sum_training = \
-            tf.summary.scalar('recall_training',
-                              self._model.recall_training)
-
-        self._model.f1_sum_validation = \
-            tf.summary.scalar('f1_score_validation',
-                              self._model.f1_score_validation)
-        self._model.f1_sum_training = \
-            tf.summary.scalar('f1_score_training',
-                              self._model.f1_score_training)
+            tf.greater_equal(self._model.sigmoid, limit, name="predictions")
+
+        # The indices and scores of the k most likely users of every row
+        self._model.top_k = \
+            tf.placeholder_with_default(self._model.user_count, [],
+                                        name="top_k")
+        top_scores, top_users = tf.nn.top_k(self._model.sigmoid,
+                                            self._model.top_k)
+        self._model.top_scores = tf.identity(top_scores, name="top_scores")
+        self._model.top_users = tf.identity(top_users, name="top_users")
+
+        self._model.evaluation = self.add_streaming_metrics("evaluation")
+        # Updated by the forward pass of the train op
+        self._model.training_metrics = self.add_streaming_metrics("training")
 
         return self
 
-    def build(self):
-        """Adds saver and init operation and returns the model"""
+    def add_streaming_metrics(self, scope):
+        """Adds precision, recall, F1 score and cross entropy metrics that
+        are accumulated over several batches, in their own variable scope.
+        They are local to the worker when distributed"""
+        with tf.device(self._model.worker_device), \
+                tf.variable_scope(scope):
+            precision, precision_update = \
+                tf.metrics.precision(self._model.target,
+                                     self._model.predictions)
+            recall, recall_update = \
+                tf.metrics.recall(self._model.target,
+                                  self._model.predictions)
+            # Weight each batch by its size, the last one may be smaller
+            batch_size = tf.cast(tf.shape(self._model.target)[0], tf.float32)
+            error, error_update = tf.metrics.mean(self._model.error,
+                                                  weights=batch_size)
+
+            # Calculate F1-score: 2 * (prec * recall) / (prec + recall)
+            f1_score = tf.multiply(2.0,
+                                   tf.truediv(tf.multiply(precision, recall),
+                                              tf.add(precision, recall)))
+            # Convert to 0 if f1 score is NaN
+            f1_score = tf.where(tf.is_nan(f1_score),
+                                tf.zeros_like(f1_score),
+                                f1_score)
+
+        metric_variables = tf.get_collection(tf.GraphKeys.LOCAL_VARIABLES,
+                                             scope=scope + '/')
+        return StreamingMetrics(
+            precision=precision,
+            recall=recall,
+            f1_score=f1_score,
+            error=error,
+            update=tf.group(precision_update, recall_update, error_update),
+            reset=tf.variables_initializer(metric_variables))
+
+    def build(self, checkpoint=None):
+        """Adds saver and init operation and returns the model, restored
+        from the 'latest' or 'best' checkpoint. Models built for serving
+        default to the best one. When distributed, the variables are placed
+        on the parameter servers and only the chief restores them"""
+        if self._model.cluster is None:
+            return self._build(checkpoint)
+        with tf.device(tf.train.replica_device_setter(
+                worker_device=self._model.worker_device,
+                cluster=self._model.cluster)):
+            return self._build(checkpoint)
+
+    def _build(self, checkpoint):
+        """Builds the graph of the model, see build"""
 
         # Add input layer
         self.add_input_layer()
@@ -321,14 +574,31 @@ class ModelBuilder(object):
             .add_precision_operations()
 
         # Initialize
-        self._model.train_writer = \
-            tf.summary.FileWriter(self._model.logging_dir + '/' + TENSOR_DIR_TRAIN,
-                                  self._model._session.graph)
-        self._model.valid_writer = \
-            tf.summary.FileWriter(self._model.logging_dir + '/' + TENSOR_DIR_VALID)
+        if self._model.cluster is not None:
+            # Not in any collection, so it isn't saved in checkpoints
+            self._model.stop_training = tf.Variable(
+                False, trainable=False, collections=[], name="stop_training")
+            self._model.request_stop = self._model.stop_training.assign(True)
+            self._model.uninitialized = tf.report_uninitialized_variables(
+                tf.global_variables() + [self._model.stop_training])
 
         self._model.init_op = tf.group(tf.global_variables_initializer(),
                                        tf.local_variables_initializer())
         self._model.saver = tf.train.Saver()
-        self._model.load_checkpoint()
+        self._model.checkpoint_writer = CheckpointWriter(
+            self._model.checkpoints_dir, tf.global_variables(),
+            self._model.keep_best_checkpoints,
+            self._model.checkpoint_queue_size,
+            self._session_config)
+        if self._quantized is None and not self._model.is_chief:
+            # The chief initializes or restores the shared variables
+            self._model.wait_for_chief()
+        elif self._quantized is None:
+            self._model.load_checkpoint(
+                checkpoint or ('best' if self._model.serving else 'latest'))
+        else:
+            # The quantized weights are only needed to initialize them
+            self._model._session.run(self._model.init_op,
+                                     self._quantized_feed)
+            self._quantized, self._quantized_feed = None, {}
         return self._model
@@ -0,0 +1,128 @@
+# MIT License
+#
+# Copyright (c) 2017 Jonatan Almén, Alexander Håkansson, Jesper Jaxing, Gmal
+# Tchaefa, Maxim Goretskyy, Axel Olivecrona
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+""" Serving predictions from a trained model
+
+Predictor holds the prediction methods shared by the Model, which is built
+for training, and the FrozenModel, which only loads the frozen inference
+graph written by Model.export_frozen.
+"""
+import numpy as np
+import tensorflow as tf
+from definitions import *
+from .util import helper as helper
+from .util.normalizer import normalize
+
+# Names of the outputs kept in a frozen inference graph
+FROZEN_OUTPUTS = ['predictions', 'top_users', 'top_scores']
+
+
+class Predictor(object):
+    """
+    Predicts users of titles, expects the session, data, input tensors and
+    prediction outputs to be set by the subclass
+    """
+    def _subreddits(self, subreddits):
+        """ Converts subreddit IDs to the form subreddit_input is fed with """
+        if self.use_subreddit_ids:
+            return subreddits
+        return helper.one_hot(subreddits, self.subreddit_count)
+
+    def _titles(self, titles, lengths):
+        """ Feeds a batch of titles, and their lengths when bucketing """
+        feed_dict = {self.input: titles}
+        if self.use_bucketing:
+            feed_dict[self.sequence_length] = lengths
+        return feed_dict
+
+    def _prediction_input(self, title, subreddit):
+        """ Feeds a single title and subreddit """
+        input_vec, input_len, _, _ = \
+            helper.encode_titles([normalize(title)],
+                                 self.data.word_dict,
+                                 self.data.max_title_length,
+                                 pad_left=not self.use_bucketing)
+        feed_dict = self._titles(input_vec, input_len)
+        if self.subreddit_input is not None:
+            subreddit_vec = helper.encode_subreddits([subreddit],
+                                                     self.data.subreddit_dict)
+            feed_dict[self.subreddit_input] = self._subreddits(subreddit_vec)
+        return feed_dict
+
+    def predict(self, title, subreddit='UNK', k=None):
+        """ Make a prediction based on a title and a subreddit. Returns the
+        users above the prediction limit, or the k most likely users """
+        if k is not None:
+            return [user for user, _ in
+                    self.predict_top_k(title, subreddit, k)]
+        users = self._session.run(self.predictions,
+                                  self._prediction_input(title, subreddit))
+        return [self.data.rev_users_dict[i] for i in np.flatnonzero(users[0])]
+
+    def predict_top_k(self, title, subreddit='UNK', k=5):
+        """ Returns the k most likely users of a title and a subreddit
+        together with their scores, most likely first """
+        feed_dict = self._prediction_input(title, subreddit)
+        feed_dict[self.top_k] = max(0, min(k, self.user_count))
+        users, scores = self._session.run([self.top_users, self.top_scores],
+                                          feed_dict)
+        return [(self.data.rev_users_dict[user], float(score))
+                for user, score in zip(users[0], scores[0])]
+
+
+def _optional_tensor(graph, name):
+    """ Returns a tensor of a graph, or None if the graph doesn't have it """
+    try:
+        return graph.get_tensor_by_name(name)
+    except KeyError:
+        return None
+
+
+class FrozenModel(Predictor):
+    """
+    Serves predictions from a frozen inference graph, which only holds the
+    operations needed to predict and the weights as constants. Nothing of
+    the training graph, like optimizers or metrics, is built or restored.
+    """
+    def __init__(self, config, session, path, data):
+        self._session = session
+        self.data = data
+        self.use_bucketing = config.get(BUCKET_BY_LENGTH, False)
+        self.use_subreddit_ids = config.get(USE_SUBREDDIT_IDS, False)
+        self.subreddit_count = data.subreddit_count
+        self.user_count = config[USER_COUNT]
+
+        graph_def = tf.GraphDef()
+        with open(path, 'rb') as source:
+            graph_def.ParseFromString(source.read())
+        with session.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+
+        graph = session.graph
+        self.input = graph.get_tensor_by_name('input:0')
+        # Only in the graph if the predictions depend on them
+        self.sequence_length = _optional_tensor(graph, 'sequence_length:0')
+        self.subreddit_input = _optional_tensor(graph, 'subreddit_input:0')
+        self.top_k = graph.get_tensor_by_name('top_k:0')
+        self.predictions, self.top_users, self.top_scores = \
+            [graph.get_tensor_by_name(name + ':0') for name in FROZEN_OUTPUTS]
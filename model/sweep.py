@@ -0,0 +1,137 @@
+# MIT License
+#
+# Copyright (c) 2017 Jonatan Almén, Alexander Håkansson, Jesper Jaxing, Gmal
+# Tchaefa, Maxim Goretskyy, Axel Olivecrona
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+"""
+Trains several configs concurrently in a pool of processes. Every process
+is pinned to a set of cores of its own and TensorFlow is limited to as many
+threads, so small models don't leave most of a large machine idle.
+"""
+import os
+import sys
+import multiprocessing
+from concurrent import futures
+from definitions import *
+from .trainer import train_config
+from .util import ingest
+from .util.csv_reader import CsvReader, Dataenum
+from .util.data import Data
+
+# The cores the worker process is pinned to, set when it starts
+_worker_cores = None
+
+
+def core_sets(workers, cores_per_worker, cores=None):
+    """ Splits the cores, by default those this process may run on, into a
+    set for every worker, as many workers as there are sets of cores if
+    workers is 0 """
+    cores = cores or sorted(os.sched_getaffinity(0))
+    cores_per_worker = min(cores_per_worker, len(cores))
+    workers = workers or max(1, len(cores) // cores_per_worker)
+    return [[cores[(worker * cores_per_worker + core) % len(cores)]
+             for core in range(cores_per_worker)]
+            for worker in range(workers)]
+
+
+def cache_datasets(configs):
+    """ Preprocesses and encodes the datasets of the configs into the
+    dataset caches once. The workers then open the memory-mapped encoded
+    arrays, which are shared through the page cache, instead of each
+    cleaning, encoding and holding a copy of them """
+    cached = set()
+    for config in configs:
+        files = tuple(config[datatype.value] for datatype in Dataenum) + \
+            ((config[PRE_TRAINED_MATRIX],) if config[USE_PRETRAINED] else ())
+        if not config.get(USE_DATA_CACHE, True):
+            continue
+        if config.get(STREAMING):
+            # The training data is streamed, only the cleaned datasets are
+            # cached
+            if files in cached:
+                continue
+            cached.add(files)
+            print("Caching datasets of config", config[NET_NAME])
+            reader = CsvReader(config)
+            for datatype in Dataenum:
+                reader.get_data(datatype)
+            if config[USE_PRETRAINED]:
+                reader.load_pretrained_embeddings(config[PRE_TRAINED_MATRIX],
+                                                  config[EMBEDD_SIZE])
+        else:
+            # Returns at once when the encoded datasets are already cached
+            print("Caching encoded datasets of config", config[NET_NAME])
+            Data(config)
+    # The workers read the cache, the ingest processes aren't needed
+    ingest.shutdown_pool()
+
+
+def _init_worker(core_queue):
+    """ Pins a new worker process to the next free set of cores """
+    global _worker_cores
+    _worker_cores = core_queue.get()
+    os.sched_setaffinity(0, _worker_cores)
+
+
+def _train_worker(config, settings):
+    """ Trains a config with as many threads as the worker has cores """
+    settings = dict(settings, **{
+        CPU_AFFINITY: _worker_cores,
+        INTRA_OP_THREADS: len(_worker_cores),
+        # A few inter-op threads unless set, TensorFlow would use all cores
+        INTER_OP_THREADS: settings[INTER_OP_THREADS] or 2})
+    config = dict(config, **{INGEST_WORKERS: len(_worker_cores)})
+    return train_config(config, settings)
+
+
+def run_sweep(configs, settings, workers=0, cores_per_worker=4):
+    """ Trains the configs in a pool of worker processes with the session
+    settings, but the threads and cores of each worker. The results of
+    each config are logged by the model to the shared results file """
+    cache_datasets(configs)
+    cores = core_sets(workers, cores_per_worker, settings[CPU_AFFINITY])
+
+    # Forking a process that has used TensorFlow isn't safe
+    context = multiprocessing.get_context('spawn')
+    core_queue = context.Queue()
+    for worker_cores in cores:
+        core_queue.put(worker_cores)
+
+    print("Training", len(configs), "configs in", len(cores), "processes of",
+          len(cores[0]), "cores")
+    completed = 0
+    with futures.ProcessPoolExecutor(len(cores), mp_context=context,
+                                     initializer=_init_worker,
+                                     initargs=(core_queue,)) as executor:
+        jobs = {executor.submit(_train_worker, config, settings):
+                config[NET_NAME] for config in configs}
+        for job in futures.as_completed(jobs):
+            try:
+                done = job.result()
+            except Exception as e:
+                # The worker process itself failed
+                print("Config ", jobs[job], "failed to complete",
+                      file=sys.stderr)
+                print(e, file=sys.stderr)
+                done = False
+            completed += done
+            print("Config", jobs[job], "completed" if done else "failed")
+    print(completed, "of", len(configs), "configs completed")
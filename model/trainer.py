@@ -0,0 +1,66 @@
+# MIT License
+#
+# Copyright (c) 2017 Jonatan Almén, Alexander Håkansson, Jesper Jaxing, Gmal
+# Tchaefa, Maxim Goretskyy, Axel Olivecrona
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+""" Training of a single config in a graph and session of its own """
+import sys
+import tensorflow as tf
+from definitions import *
+from .model_builder import ModelBuilder
+from .util.session_config import session_settings, session_config, \
+    log_settings
+
+
+def train_config(config_file, settings=None, cluster=None, task_index=0):
+    """ Builds and trains the model of a config in a session with the
+    session settings, as a worker of the cluster if given. Returns whether
+    it completed, failures are printed so the next config can be trained """
+    settings = settings or session_settings()
+    try:
+        target, config = '', session_config(settings)
+        if cluster is not None:
+            server = tf.train.Server(cluster, job_name='worker',
+                                     task_index=task_index, config=config)
+            target = server.target
+            # Workers only depend on the parameter servers, not each other
+            config.device_filters.extend(['/job:ps',
+                                          '/job:worker/task:%d' % task_index])
+        with tf.Session(target, config=config) as sess:
+            builder = ModelBuilder(config_file, sess, cluster=cluster,
+                                   task_index=task_index,
+                                   session_config=config)
+
+            network_model = builder.build()
+            if network_model.is_chief:
+                log_settings(settings, network_model.logging_dir)
+            if config_file[USE_PRETRAINED_NET]:
+                network_model.train(USE_PRETRAINED_NET)
+            network_model.train()
+            network_model.close_writers()
+        return True
+    except Exception as e:
+        print("Config ", config_file[NET_NAME], "failed to complete",
+              file=sys.stderr)
+        print(e, file=sys.stderr)
+        return False
+    finally:
+        tf.reset_default_graph()
@@ -0,0 +1,252 @@
+# MIT License
+#
+# Copyright (c) 2017 Jonatan Almén, Alexander Håkansson, Jesper Jaxing, Gmal
+# Tchaefa, Maxim Goretskyy, Axel Olivecrona
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+"""
+On-disk caches for preprocessed data.
+
+Cached entries are stored as plain .npy files inside a directory named after
+the cache key. Cleaned datasets are read back into Python strings, so their
+cache only saves the cleaning, while encoded datasets and embedding matrices
+are memory-mapped.
+"""
+import os
+import json
+import shutil
+import hashlib
+import collections
+import numpy as np
+import definitions
+
+
+def file_digest(file_path, block_size=1 << 20):
+    """ Returns the SHA-1 hex digest of the contents of a file """
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as source:
+        for block in iter(lambda: source.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DatasetCache(object):
+    """
+    A cache of preprocessed string columns. Each column is stored as one
+    UTF-8 encoded blob together with the character offsets of its rows,
+    optionally along with counters computed from the columns. Loading an
+    entry decodes it into lists of strings again, it isn't memory-mapped.
+    """
+    # Bump whenever the layout of a cache entry changes
+    FORMAT_VERSION = 2
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or definitions.CACHE_PATH
+
+    def key(self, file_path, version, *params):
+        """ Builds a cache key from the contents of a file, the version of
+        the preprocessing and any parameters affecting the result """
+        digest = hashlib.sha1()
+        digest.update(file_digest(file_path).encode())
+        digest.update(str((self.FORMAT_VERSION, version)).encode())
+        digest.update(repr(params).encode())
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        return name + '-' + digest.hexdigest()[:16]
+
+    def load(self, key):
+        """ Returns the cached columns for the key decoded into lists of
+        strings, or None if missing """
+        entry = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry):
+            return None
+        columns = []
+        index = 0
+        while os.path.isfile(os.path.join(entry, 'offsets%d.npy' % index)):
+            blob = np.load(os.path.join(entry, 'column%d.npy' % index))
+            offsets = np.load(os.path.join(entry,
+                                           'offsets%d.npy' % index)).tolist()
+            text = blob.tobytes().decode('UTF-8')
+            columns.append([text[start:end] for start, end
+                            in zip(offsets[:-1], offsets[1:])])
+            index += 1
+        return tuple(columns) if columns else None
+
+    def load_counts(self, key):
+        """ Returns the cached counters for the key, or None if missing """
+        counts_file = os.path.join(self.cache_dir, key, 'counts.json')
+        if not os.path.isfile(counts_file):
+            return None
+        with open(counts_file, 'r', encoding='UTF-8') as source:
+            return tuple(collections.Counter(dict(counter))
+                         for counter in json.load(source))
+
+    def save(self, key, columns, counts=None):
+        """ Writes the columns (lists of strings) and counters to the cache """
+        entry = os.path.join(self.cache_dir, key)
+        tmp_entry = entry + '.tmp%d' % os.getpid()
+        os.makedirs(tmp_entry, exist_ok=True)
+        for index, column in enumerate(columns):
+            offsets = np.zeros(len(column) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in column], out=offsets[1:])
+            blob = np.frombuffer("".join(column).encode('UTF-8'),
+                                 dtype=np.uint8)
+            np.save(os.path.join(tmp_entry, 'column%d.npy' % index), blob)
+            np.save(os.path.join(tmp_entry, 'offsets%d.npy' % index), offsets)
+        if counts is not None:
+            with open(os.path.join(tmp_entry, 'counts.json'), 'w',
+                      encoding='UTF-8') as target:
+                json.dump([list(counter.items()) for counter in counts],
+                          target)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Another process has already written the same entry
+            shutil.rmtree(tmp_entry)
+
+
+class EncodedCache(object):
+    """
+    A cache of encoded datasets. The arrays are stored as .npy files that
+    are opened with memory-mapping, so processes training on the same data
+    share one copy of them through the page cache, and the dictionaries
+    they were encoded with are stored as JSON.
+    """
+    # Bump whenever the layout of a cache entry changes
+    FORMAT_VERSION = 1
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or definitions.CACHE_PATH
+
+    def key(self, name, dataset_keys, *params):
+        """ Builds a cache key from the keys of the cleaned datasets and
+        any parameters of the encoding """
+        digest = hashlib.sha1()
+        digest.update(repr((self.FORMAT_VERSION, dataset_keys,
+                            params)).encode())
+        return name + '-encoded-' + digest.hexdigest()[:16]
+
+    def load(self, key):
+        """ Returns the memory-mapped arrays, by name, and the dictionaries
+        of the key, or None if missing """
+        entry = os.path.join(self.cache_dir, key)
+        meta_file = os.path.join(entry, 'meta.json')
+        if not os.path.isfile(meta_file):
+            return None
+        with open(meta_file, 'r', encoding='UTF-8') as source:
+            meta = json.load(source)
+        arrays = {name[:-len('.npy')]:
+                  np.load(os.path.join(entry, name), mmap_mode='r')
+                  for name in os.listdir(entry) if name.endswith('.npy')}
+        return arrays, meta
+
+    def save(self, key, arrays, meta):
+        """ Writes the arrays, a dict of names and arrays, and the
+        dictionaries in meta to the cache """
+        entry = os.path.join(self.cache_dir, key)
+        tmp_entry = entry + '.tmp%d' % os.getpid()
+        os.makedirs(tmp_entry, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_entry, name + '.npy'), array)
+        with open(os.path.join(tmp_entry, 'meta.json'), 'w',
+                  encoding='UTF-8') as target:
+            json.dump(meta, target)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Another process has already written the same entry
+            shutil.rmtree(tmp_entry)
+
+
+class EmbeddingCache(object):
+    """
+    A cache of pretrained embeddings converted from text to a .npy matrix,
+    which is opened with memory-mapping, and a vocabulary file with one word
+    per row of the matrix. Row 0 is the UNK vector.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or definitions.CACHE_PATH
+
+    def _entry(self, file_path):
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        return os.path.join(self.cache_dir, name + '-embeddings')
+
+    def stamp(self, file_path):
+        """ Identifies the version of the text file the cache was made of """
+        stat = os.stat(file_path)
+        return {'format': self.FORMAT_VERSION,
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns}
+
+    def load(self, file_path, read_rows, dimension_size):
+        """ Returns the word dictionary and memory-mapped matrix of an
+        embeddings file, converting it first if the cache is stale.
+        read_rows(file_path) must return an iterator over the (word, values)
+        rows of the file, it is called twice when converting. """
+        entry = self._entry(file_path)
+        meta_file = os.path.join(entry, 'meta.json')
+        stamp = self.stamp(file_path)
+        stale = True
+        if os.path.isfile(meta_file):
+            with open(meta_file, 'r', encoding='UTF-8') as source:
+                stale = json.load(source) != stamp
+        if stale:
+            self._convert(file_path, read_rows, dimension_size, entry, stamp)
+
+        with open(os.path.join(entry, 'vocabulary.txt'), 'r',
+                  encoding='UTF-8', newline='') as source:
+            words = source.read().split('\n')
+        word_dict = {word: index for index, word in enumerate(words)}
+        matrix = np.load(os.path.join(entry, 'matrix.npy'), mmap_mode='r')
+        return word_dict, matrix
+
+    def _convert(self, file_path, read_rows, dimension_size, entry, stamp):
+        """ Converts the text file in two passes, the rows are written
+        straight to the memory-mapped matrix """
+        words = ['UNK']
+        for word, values in read_rows(file_path):
+            words.append(word)
+            dimension_size = len(values)
+
+        tmp_entry = entry + '.tmp%d' % os.getpid()
+        os.makedirs(tmp_entry, exist_ok=True)
+        matrix = np.lib.format.open_memmap(
+            os.path.join(tmp_entry, 'matrix.npy'), mode='w+',
+            dtype=np.float32, shape=(len(words), dimension_size))
+        matrix[0] = np.random.rand(dimension_size)
+        for index, (_, values) in enumerate(read_rows(file_path), start=1):
+            matrix[index] = np.array(values, dtype=np.float32)
+        matrix.flush()
+        del matrix
+
+        with open(os.path.join(tmp_entry, 'vocabulary.txt'), 'w',
+                  encoding='UTF-8', newline='') as target:
+            target.write('\n'.join(words))
+        with open(os.path.join(tmp_entry, 'meta.json'), 'w',
+                  encoding='UTF-8') as target:
+            json.dump(stamp, target)
+
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Another process has already written the same entry
+            shutil.rmtree(tmp_entry)
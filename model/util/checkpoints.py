@@ -0,0 +1,188 @@
+# MIT License
+#
+# Copyright (c) 2017 Jonatan Almén, Alexander Håkansson, Jesper Jaxing, Gmal
+# Tchaefa, Maxim Goretskyy, Axel Olivecrona
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+"""
+Checkpoints written in the background. The values of the variables are
+copied when a checkpoint is saved and written by a thread with a graph of
+its own, so training only waits for the copy, or for the queue of pending
+checkpoints to have room. Every checkpoint gets a file of its own and only
+the latest and the best few by validation F1 score are kept.
+"""
+import os
+import json
+import glob
+import queue
+import threading
+import tensorflow as tf
+
+INDEX_FILE = 'index.json'
+
+
+class CheckpointWriter(object):
+    def __init__(self, checkpoint_path, variables, keep_best=3,
+                 queue_size=1, config=None):
+        """ Saves the variables to versions of checkpoint_path, keeping the
+        keep_best with the highest F1 scores and the latest. At most
+        queue_size checkpoints wait to be written, by a session with the
+        ConfigProto config """
+        self.checkpoint_path = checkpoint_path
+        self.keep_best = keep_best
+        self._variables = variables
+        self._config = config
+        self._index_path = os.path.join(os.path.dirname(checkpoint_path),
+                                        INDEX_FILE)
+        self._queue = queue.Queue(queue_size)
+        self._thread = None
+        self._error = None
+        # Set if the writer thread couldn't start, nothing is written then
+        self._failed = False
+
+    def _read_index(self):
+        """ The saved checkpoints, oldest first, and the latest one """
+        if not os.path.isfile(self._index_path):
+            return {'checkpoints': [], 'latest': None, 'next_version': 0}
+        with open(self._index_path, 'r') as source:
+            return json.load(source)
+
+    def _write_index(self, index):
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'w') as target:
+            json.dump(index, target, indent=2)
+        os.replace(tmp_path, self._index_path)
+
+    def path(self, which='latest'):
+        """ The path of the latest checkpoint or the one with the best F1
+        score, None if there is none """
+        index = self._read_index()
+        if which == 'best':
+            scored = [checkpoint for checkpoint in index['checkpoints']
+                      if checkpoint['f1_score'] is not None]
+            if scored:
+                return max(scored, key=lambda c: c['f1_score'])['path']
+        elif which != 'latest':
+            raise ValueError("Unknown checkpoint: " + str(which))
+        return index['latest']
+
+    def save(self, session, epoch, f1_score=None):
+        """ Copies the values of the variables and queues them to be
+        written, blocks while the queue is full """
+        self._raise_error()
+        values = session.run(self._variables)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._write_checkpoints,
+                                             daemon=True)
+            self._thread.start()
+        self._queue.put((values, epoch, f1_score))
+
+    def wait(self):
+        """ Blocks until every queued checkpoint has been written """
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """ Writes the queued checkpoints and stops the writer thread """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error = self._error
+            if not self._failed:
+                self._error = None
+            raise error
+
+    def _write_checkpoints(self):
+        """ Writes the queued values with a saver of a graph of its own,
+        whose variables have the names of the copied ones """
+        try:
+            graph = tf.Graph()
+            with graph.as_default():
+                placeholders = [tf.placeholder(variable.dtype.base_dtype,
+                                               variable.get_shape())
+                                for variable in self._variables]
+                copies = [tf.Variable(placeholder, trainable=False)
+                          for placeholder in placeholders]
+                assign = tf.variables_initializer(copies)
+                saver = tf.train.Saver(
+                    {variable.op.name: copy
+                     for variable, copy in zip(self._variables, copies)},
+                    max_to_keep=None)
+            session = tf.Session(graph=graph, config=self._config)
+        except Exception as e:
+            # Raised by every later save and wait, the queue is drained so
+            # they don't block
+            self._error = e
+            self._failed = True
+            self._drain()
+            return
+        with session:
+            while True:
+                item = self._queue.get()
+                try:
+                    if item is None:
+                        return
+                    values, epoch, f1_score = item
+                    session.run(assign, dict(zip(placeholders, values)))
+                    self._write(session, saver, epoch, f1_score)
+                except Exception as e:
+                    # Raised in the training thread on the next call
+                    self._error = e
+                finally:
+                    self._queue.task_done()
+
+    def _drain(self):
+        """ Discards the queued checkpoints until the writer is closed """
+        while True:
+            item = self._queue.get()
+            self._queue.task_done()
+            if item is None:
+                return
+
+    def _write(self, session, saver, epoch, f1_score):
+        """ Writes a new version of the checkpoint and removes the ones
+        that aren't kept anymore """
+        index = self._read_index()
+        path = saver.save(session, self.checkpoint_path,
+                          global_step=index['next_version'],
+                          write_meta_graph=False, write_state=False)
+        index['next_version'] += 1
+        index['latest'] = path
+        index['checkpoints'].append({'path': path, 'epoch': int(epoch),
+                                     'f1_score': None if f1_score is None
+                                     else float(f1_score)})
+
+        scored = [checkpoint for checkpoint in index['checkpoints']
+                  if checkpoint['f1_score'] is not None]
+        best = sorted(scored, key=lambda c: c['f1_score'],
+                      reverse=True)[:self.keep_best]
+        kept = [checkpoint for checkpoint in index['checkpoints']
+                if checkpoint in best or checkpoint['path'] == path]
+        for checkpoint in index['checkpoints']:
+            if checkpoint not in kept:
+                for file in glob.glob(checkpoint['path'] + '.*'):
+                    os.remove(file)
+        index['checkpoints'] = kept
+        self._write_index(index)
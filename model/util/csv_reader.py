@@ -23,11 +23,17 @@
 # ==============================================================================
 from enum import Enum
 
-import re
 import os
 import csv
 import numpy as np
-from definitions import DATASETS_PATH
+from definitions import DATASETS_PATH, USE_DATA_CACHE, INGEST_WORKERS, \
+    INGEST_CHUNK_SIZE
+from . import ingest
+from .cache import DatasetCache, EmbeddingCache
+
+# Bump whenever the cleaning in ingest or the normalizer changes, this
+# invalidates previously cached datasets
+PREPROCESSING_VERSION = 2
 
 
 class Dataenum(Enum):
@@ -39,48 +45,84 @@ class CsvReader:
     def __init__(self, netcfg):
         self.netcfg = netcfg
         self.encoding = 'UTF-8'
+        self.cache = DatasetCache() \
+            if netcfg.get(USE_DATA_CACHE, True) else None
+        self.embedding_cache = EmbeddingCache() \
+            if netcfg.get(USE_DATA_CACHE, True) else None
+        self.workers = netcfg.get(INGEST_WORKERS) or \
+            ingest.default_workers()
+        self.chunk_size = netcfg.get(INGEST_CHUNK_SIZE, 10000)
+        # (words, users, subreddits) counters of each read dataset
+        self.counts = dict()
 
     def get_data(self, datatype, data_column=[0], sub_column=1, label_column=2):
-        """ A function that reads the data and
-        corresponding label from a CSV file """
+        """ A function that reads the data and corresponding label from a
+        CSV file, using the preprocessed cache when it is up to date. The
+        word, user and subreddit counts of the file are stored in counts """
         file_path = os.path.join(DATASETS_PATH, self.netcfg[datatype.value])
-        with open(file_path, 'r', encoding=self.encoding) as csvfile:
-            reader = csv.reader(csvfile)
-            data_full = []
-            subreddit_full = []
-            label_full = []
-            for row in reader:
-                if len(row) < 3:
-                    print(len(row))
-                    print(row)
-                    print(datatype)
-                data = ""
-                subreddit = row[sub_column]
-                label = row[label_column]
-                for elem in data_column:
-                    col = row[elem]
-                    # replaces each number with NUMTOKEN
-                    col = re.sub('\d+', 'NUMTOKEN', col)
-                    col = re.sub('\s+NUMTOKEN\s+', ' NUMTOKEN ', col)
-
-                    for character in ['!', '?', '-', '_', '.', ',', '\'', '\"', ':', ';', '%', '(', ')']:
-                        col = str(col)
-                        col = col.replace(character, '')
-                    if col:
-                        data += col + ", "
-                label = label.replace(',', '')
-                data_full.append(data.strip(' ').strip(','))
-                label_full.append(label)
-                subreddit_full.append(subreddit)
-            return data_full, subreddit_full, label_full
+        key = self.dataset_key(datatype, data_column, sub_column,
+                               label_column)
+        if key is not None:
+            counts = self.cache.load_counts(key)
+            columns = self.cache.load(key) if counts is not None else None
+            if columns is not None:
+                self.counts[datatype] = counts
+                return columns
+
+        columns, counts = ingest.read_csv(file_path, self.encoding,
+                                          data_column, sub_column,
+                                          label_column, self.chunk_size,
+                                          self.workers)
+        if key is not None:
+            self.cache.save(key, columns, counts)
+        self.counts[datatype] = counts
+        return columns
+
+    def dataset_key(self, datatype, data_column=[0], sub_column=1,
+                    label_column=2):
+        """ The key of a cleaned dataset in the dataset cache, or None if
+        caching is disabled """
+        if self.cache is None:
+            return None
+        file_path = os.path.join(DATASETS_PATH, self.netcfg[datatype.value])
+        return self.cache.key(file_path, PREPROCESSING_VERSION, data_column,
+                              sub_column, label_column)
+
+    def embeddings_stamp(self, file_name):
+        """ Identifies the version of a pretrained embeddings file """
+        return self.embedding_cache.stamp(os.path.join(DATASETS_PATH,
+                                                       file_name))
+
+    def iter_data(self, datatype, chunk_size=None, data_column=[0],
+                  sub_column=1, label_column=2):
+        """ Reads the data of a CSV file in chunks without keeping the whole
+        file in memory. Yields the cleaned (data, subreddit, label) columns
+        of each chunk together with its (words, users, subreddits) counts """
+        file_path = os.path.join(DATASETS_PATH, self.netcfg[datatype.value])
+        return ingest.iter_csv(file_path, self.encoding, data_column,
+                               sub_column, label_column,
+                               chunk_size or self.chunk_size, self.workers)
 
     def load_pretrained_embeddings(self, file_name, dimension_size=50):
+        """ Loads pretrained embeddings, from the memory-mapped cache unless
+        caching is disabled. Returns the word dictionary and the matrix """
         file_path = os.path.join(DATASETS_PATH, file_name)
+        if self.embedding_cache is not None:
+            return self.embedding_cache.load(file_path,
+                                             self._read_embeddings,
+                                             dimension_size)
+
         matrix = [np.random.rand(dimension_size).astype(np.float32)]
         word_dict = dict()
         word_dict['UNK'] = 0
-        count = 1
+        for word, values in self._read_embeddings(file_path):
+            word_dict[word] = len(matrix)
+            matrix.append(np.array(values, dtype=np.float32))
+        return word_dict, np.array(matrix)
 
+    def _read_embeddings(self, file_path):
+        """ Yields the word and values of every used row of an embeddings
+        text file """
         with open(file_path, 'r', encoding='UTF-8') as csvfile:
             reader = csv.reader(csvfile, delimiter=' ', quoting=csv.QUOTE_NONE)
 
@@ -94,11 +136,4 @@ class CsvReader:
                 if first_col[0] == '<':
                     continue
 
-                word_dict[first_col] = count
-                row_array = np.array(row[1:], dtype=np.float32)
-                matrix.append(row_array)
-                count += 1
-        return word_dict, np.array(matrix)
-
-
-
+                yield first_col, row[1:]
@@ -25,9 +25,18 @@
 A module for handling training, validation and test data for the ANN model
 """
 
+import os
+import json
 import logging
+import collections
+import numpy as np
+from definitions import STREAM_CHUNK_SIZE, PRUNE_EMBEDDINGS, \
+    BUCKET_BY_LENGTH, USE_DATA_CACHE
 from . import helper
-from .csv_reader import CsvReader, Dataenum
+from . import ingest
+from .cache import EncodedCache
+from .labels import LabelMatrix
+from .csv_reader import CsvReader, Dataenum, PREPROCESSING_VERSION
 
 class Data(object):
     def __init__(self, networkconfig):
@@ -48,22 +57,37 @@ class Data(object):
         self.vocabulary_size = self.netcfg['vocabulary_size']
         self.user_count = self.netcfg['user_count']
         self.max_title_length = self.netcfg['max_title_length']
-        self._read_data()
-        self.embedding_matrix = None
-        self._build_dict()
+        # Right pads the titles and batches titles of similar lengths
+        self.bucket_by_length = networkconfig.get(BUCKET_BY_LENGTH, False)
+        self._train_order = None
+        self._train_sample = None
         self.train_absent = 0
         self.train_present = 0
         self.valid_absent = 0
         self.valid_present = 0
+        self.embedding_matrix = None
+        self.encoded_cache = EncodedCache() \
+            if networkconfig.get(USE_DATA_CACHE, True) else None
+        key = self._encoded_key()
+        if key is None or not self._load_encoded(key):
+            self._read_data()
+            self._build_dict()
+            self._encode_data()
+            if key is not None:
+                self._save_encoded(key)
+        self._finish_ingest()
+
+    def _finish_ingest(self):
+        """ Stops the ingest worker processes, every dataset has been
+        read """
+        ingest.shutdown_pool()
 
     def _read_data(self):
         """ Reads all the data from specified path """
 
         logging.debug("Reading training data...")
 
-        self.train_data, self.train_subreddits, self.train_labels = \
-            self.reader.get_data(Dataenum.TRAINING)
-        self.train_size = len(self.train_data)
+        self._read_training_data()
 
         logging.debug("Reading validation data...")
 
@@ -77,184 +101,263 @@ class Data(object):
             self.reader.get_data(Dataenum.TESTING)
         self.test_size = len(self.test_data)
 
+    def _read_training_data(self):
+        """ Reads the training data from specified path """
+        self.train_data, self.train_subreddits, self.train_labels = \
+            self.reader.get_data(Dataenum.TRAINING)
+        self.train_size = len(self.train_data)
+
     def _build_dict(self):
-        """ Builds dictionaries using given data """
+        """ Builds dictionaries using the counts of the training data """
         logging.debug("Building dictionaries...")
+        words, users, subreddits = self.reader.counts[Dataenum.TRAINING]
         if not self.use_pretrained:
-            vocab = " ".join(self.train_data).split()
-            _, _, self.word_dict, self.rev_dict = \
-                helper.build_dataset(vocab, vocabulary_size=self.vocabulary_size)
+            self.word_dict, self.rev_dict = \
+                helper.build_dictionary(words, self.vocabulary_size)
         else:
             self.word_dict, self.embedding_matrix = \
                 self.reader.load_pretrained_embeddings(
                     self.pre_trained_matrix,
                     self.embedding_size)
-        users = " ".join(self.train_labels).split()
-        _, _, self.users_dict, self.rev_users_dict = \
-            helper.build_dataset(users, vocabulary_size=self.user_count)
+            if self.netcfg.get(PRUNE_EMBEDDINGS):
+                self._prune_embeddings()
+        self.users_dict, self.rev_users_dict = \
+            helper.build_dictionary(users, self.user_count)
 
-        subreddits = " ".join(self.train_subreddits).split()
         self.subreddit_dict = helper.build_subreddit_dict(subreddits)
         self.subreddit_count = len(self.subreddit_dict)
 
+    def _prune_embeddings(self):
+        """ Restricts the pretrained embeddings to the words occurring in
+        any of the datasets """
+        words = set()
+        for datatype in Dataenum:
+            words.update(self.reader.counts[datatype][0])
+        self.word_dict, self.embedding_matrix = \
+            helper.prune_embeddings(self.word_dict, self.embedding_matrix,
+                                    words)
+        logging.debug("Pruned embeddings to %d words", len(self.word_dict))
+
+    def _encode_data(self):
+        """ Encodes every split once into contiguous arrays of word IDs,
+        title lengths, subreddit IDs and sparse labels, batches are sliced
+        from these """
+        logging.debug("Encoding data...")
+        self._encode_training_data()
+
+        self.valid_x, self.valid_len, self.valid_sub, self.valid_y, \
+            self.valid_present, self.valid_absent = \
+            self._encode(self.validation_data, self.valid_subreddits,
+                         self.valid_labels)
+
+        self.test_x, self.test_len, self.test_sub, self.test_y, _, _ = \
+            self._encode(self.test_data, self.test_subreddits,
+                         self.test_labels)
+
+        if self.bucket_by_length:
+            # The order doesn't matter when evaluating, so sorting once
+            # gives batches of titles with similar lengths
+            self.valid_x, self.valid_len, self.valid_sub, self.valid_y = \
+                helper.sort_by_length([self.valid_x, self.valid_len,
+                                       self.valid_sub, self.valid_y],
+                                      self.valid_len)
+            self.test_x, self.test_len, self.test_sub, self.test_y = \
+                helper.sort_by_length([self.test_x, self.test_len,
+                                       self.test_sub, self.test_y],
+                                      self.test_len)
+
+    def _encode_training_data(self):
+        """ Encodes the training data into contiguous arrays """
+        self.train_x, self.train_len, self.train_sub, self.train_y, \
+            self.train_present, self.train_absent = \
+            self._encode(self.train_data, self.train_subreddits,
+                         self.train_labels)
+
+    def _encode(self, data, subreddits, labels):
+        """ Encodes the columns of a split into arrays of word IDs, title
+        lengths and subreddit IDs and a sparse LabelMatrix of the users.
+        Also returns the number of words found and not found in the
+        dictionary """
+        data_x, data_len, present, absent = \
+            helper.encode_titles(data, self.word_dict, self.max_title_length,
+                                 pad_left=not self.bucket_by_length)
+        data_sub = helper.encode_subreddits(subreddits, self.subreddit_dict)
+        data_y = helper.encode_labels(labels, self.users_dict,
+                                      self.user_count)
+        return data_x, data_len, data_sub, data_y, present, absent
+
+    def _encoded_key(self):
+        """ The key of the encoded datasets in the encoded cache, or None if
+        caching is disabled """
+        if self.encoded_cache is None:
+            return None
+        dataset_keys = {datatype.value: self.reader.dataset_key(datatype)
+                        for datatype in Dataenum}
+        embeddings = self.reader.embeddings_stamp(self.pre_trained_matrix) \
+            if self.use_pretrained else None
+        return self.encoded_cache.key(
+            dataset_keys[Dataenum.TRAINING.value], sorted(
+                dataset_keys.items()), embeddings, self.embedding_size,
+            self.netcfg.get(PRUNE_EMBEDDINGS), self.vocabulary_size,
+            self.user_count, self.max_title_length, self.bucket_by_length)
+
+    def _save_encoded(self, key):
+        """ Writes the encoded datasets and their dictionaries to the
+        encoded cache """
+        arrays = dict()
+        for split in ['train', 'valid', 'test']:
+            for name in ['x', 'len', 'sub']:
+                arrays[split + '_' + name] = \
+                    getattr(self, split + '_' + name)
+            labels = getattr(self, split + '_y')
+            arrays[split + '_y_indptr'] = labels.indptr
+            arrays[split + '_y_indices'] = labels.indices
+        if self.use_pretrained and self.netcfg.get(PRUNE_EMBEDDINGS):
+            arrays['embeddings'] = self.embedding_matrix
+        meta = {'word_dict': self.word_dict,
+                'users': [self.rev_users_dict[index]
+                          for index in range(len(self.rev_users_dict))],
+                'subreddit_dict': self.subreddit_dict,
+                'sizes': [self.train_size, self.validation_size,
+                          self.test_size],
+                'stats': list(self.get_stats())}
+        self.encoded_cache.save(key, arrays, meta)
+
+    def _load_encoded(self, key):
+        """ Opens the encoded datasets of the key in the encoded cache,
+        memory-mapped. Returns False if they aren't cached """
+        entry = self.encoded_cache.load(key)
+        if entry is None:
+            return False
+        arrays, meta = entry
+        for split in ['train', 'valid', 'test']:
+            for name in ['x', 'len', 'sub']:
+                setattr(self, split + '_' + name,
+                        arrays[split + '_' + name])
+            setattr(self, split + '_y',
+                    LabelMatrix(arrays[split + '_y_indptr'],
+                                arrays[split + '_y_indices'],
+                                self.user_count))
+        self.word_dict = meta['word_dict']
+        if not self.use_pretrained:
+            self.rev_dict = {index: word
+                             for word, index in self.word_dict.items()}
+        elif self.netcfg.get(PRUNE_EMBEDDINGS):
+            self.embedding_matrix = arrays['embeddings']
+        else:
+            _, self.embedding_matrix = \
+                self.reader.load_pretrained_embeddings(
+                    self.pre_trained_matrix, self.embedding_size)
+        self.users_dict = {user: index
+                           for index, user in enumerate(meta['users'])}
+        self.rev_users_dict = dict(enumerate(meta['users']))
+        self.subreddit_dict = meta['subreddit_dict']
+        self.subreddit_count = len(self.subreddit_dict)
+        self.train_size, self.validation_size, self.test_size = meta['sizes']
+        self.train_present, self.train_absent, self.valid_present, \
+            self.valid_absent = meta['stats']
+        logging.debug("Loaded encoded data from the cache")
+        return True
+
+    def _trim(self, batch):
+        """ Cuts the padding after the longest title off a batch when the
+        titles are right padded """
+        batch_x, batch_len = batch[0], batch[1]
+        if self.bucket_by_length:
+            batch_x = helper.trim_titles(batch_x, batch_len)
+        return [batch_x, batch_len] + list(batch[2:])
+
     def next_train_batch(self, batch_size=None):
         """ Get the next batch of training data """
         batch_size = batch_size or self.batch_size
-        batch_x = []
-        batch_sub = []
-        batch_y = []
-        for _ in range(0, batch_size):
-            sentence = self.train_data[self._current_train_index]
-            subreddit = self.train_subreddits[self._current_train_index]
-            label = self.train_labels[self._current_train_index]
-            self._current_train_index += 1
-            # Support multiple epochs
-            if self._current_train_index >= self.train_size:
-                self._current_train_index = 0
-                self.completed_training_epochs += 1
-                self.percent_of_epoch = 0.0
-            # TODO Detta ska inte ligga i funktionen som generar ny data
-
-            # Turn sentences and labels into vector representations
-            sentence_vec, present, absent = \
-                helper.get_indicies(sentence,
-                                    self.word_dict,
-                                    self.max_title_length)
-            self.train_present += present
-            self.train_absent += absent
-
-            subreddit_vec = helper.label_vector(subreddit,
-                                                self.subreddit_dict,
-                                                self.subreddit_count)
-
-            label_vec = helper.label_vector(label.split(), self.users_dict,
-                                            self.user_count)
-            batch_x.append(sentence_vec)
-            batch_sub.append(subreddit_vec)
-            batch_y.append(label_vec)
+        arrays = [self.train_x, self.train_len, self.train_sub, self.train_y]
+        if self.bucket_by_length:
+            return self._next_bucketed_batch(arrays, batch_size)
+        batch, self._current_train_index, epochs = \
+            helper.take_rows(arrays, self._current_train_index, batch_size)
+        # Support multiple epochs
+        self.completed_training_epochs += epochs
+        self.percent_of_epoch = self._current_train_index / self.train_size
+        return batch
+
+    def _next_bucketed_batch(self, arrays, batch_size):
+        """ Get the next batch of titles with similar lengths, the batches
+        are reordered every epoch and never span two epochs """
+        if self._current_train_index == 0:
+            self._train_order = helper.bucket_order(self.train_len,
+                                                    batch_size)
+        positions = self._train_order[self._current_train_index:
+                                      self._current_train_index + batch_size]
+        self._current_train_index += len(positions)
+        if self._current_train_index >= self.train_size:
+            self._current_train_index = 0
+            self.completed_training_epochs += 1
+        self.percent_of_epoch = self._current_train_index / self.train_size
+        return self._trim([array.take(positions, axis=0)
+                           for array in arrays])
 
+    def skip_train_batch(self, batch_size=None):
+        """ Moves past the next batch of training data without reading it,
+        for when the batches are read by the input pipeline """
+        batch_size = batch_size or self.batch_size
+        # Support multiple epochs
+        self._current_train_index += batch_size
+        self.completed_training_epochs += \
+            self._current_train_index // self.train_size
+        self._current_train_index %= self.train_size
         self.percent_of_epoch = self._current_train_index / self.train_size
-        return batch_x, batch_sub, batch_y
 
     def next_pre_train_batch(self, batch_size=None):
-        """ Get the next batch of training data """
+        """ Get the next batch of training data, labeled by subreddit """
         batch_size = batch_size or self.batch_size
-        batch_x = []
-        batch_y = []
-        batch_sub = []
-
-        for _ in range(0, batch_size):
-            sentence = self.train_data[self._current_pre_train_index]
-            subreddit = self.train_subreddits[self._current_pre_train_index]
-            label = self.train_labels[self._current_pre_train_index]
-            self._current_pre_train_index += 1
-            # Support multiple epochs
-            if self._current_pre_train_index >= self.train_size:
-                self._current_pre_train_index = 0
-
-            # Turn sentences and labels into vector representations
-            sentence_vec, present, absent = \
-                helper.get_indicies(sentence,
-                                    self.word_dict,
-                                    self.max_title_length)
-            self.train_present += present
-            self.train_absent += absent
-
-            subreddit_vec = helper.label_vector(subreddit,
-                                                self.subreddit_dict,
-                                                self.subreddit_count)
-            batch_x.append(sentence_vec)
-            batch_y.append(subreddit_vec)
-            batch_sub.append(subreddit_vec)
-
-
-        return batch_x, batch_sub, batch_y
+        (batch_x, batch_len, batch_sub), self._current_pre_train_index, _ = \
+            helper.take_rows([self.train_x, self.train_len, self.train_sub],
+                             self._current_pre_train_index, batch_size)
+        return self._trim([batch_x, batch_len, batch_sub, batch_sub])
 
     def get_validation(self):
         """ Get the whole validation set in a vectorized form """
-        old_ind = self._current_valid_index
-        self._current_valid_index = 0
-        batch_x, batch_sub, batch_y = self.next_valid_batch()
-        self._current_valid_index = old_ind
-        return batch_x, batch_sub, batch_y
+        return self.valid_x, self.valid_len, self.valid_sub, self.valid_y
 
     def next_valid_batch(self, batch_size=None):
         """ Get the next batch of validation data """
         batch_size = batch_size or self.batch_size
-        batch_x = []
-        batch_sub = []
-        batch_y = []
-        for _ in range(0, batch_size):
-            sentence = self.validation_data[self._current_valid_index]
-            subreddit = self.valid_subreddits[self._current_valid_index]
-            label = self.valid_labels[self._current_valid_index]
-
-            self._current_valid_index += 1
-
-            # Support multiple epochs
-            if self._current_valid_index >= self.validation_size:
-                self._current_valid_index = 0
-
-            # Turn sentences and labels into vectors
-            sentence_vec, pres, absent = \
-                helper.get_indicies(sentence,
-                                    self.word_dict,
-                                    self.max_title_length)
-
-            self.valid_present += pres
-            self.valid_absent += absent
-
-            subreddit_vec = helper.label_vector(subreddit,
-                                                self.subreddit_dict,
-                                                self.subreddit_count)
-
-            label_vec = helper.label_vector(label.split(), self.users_dict,
-                                            self.user_count)
-            batch_x.append(sentence_vec)
-            batch_sub.append(subreddit_vec)
-            batch_y.append(label_vec)
-        return batch_x, batch_sub, batch_y
+        batch, self._current_valid_index, _ = \
+            helper.take_rows([self.valid_x, self.valid_len, self.valid_sub,
+                              self.valid_y],
+                             self._current_valid_index, batch_size)
+        return self._trim(batch)
+
+    def iter_validation(self, batch_size=None):
+        """ Iterates once over the validation set in batches """
+        batches = helper.iter_batches([self.valid_x, self.valid_len,
+                                       self.valid_sub, self.valid_y],
+                                      batch_size or self.batch_size)
+        return map(self._trim, batches)
+
+    def iter_validation_sample(self, size, batch_size=None, seed=0):
+        """ Iterates once over a uniform random sample of size rows of the
+        validation set in batches, the same sample for the same seed """
+        rows = np.sort(np.random.RandomState(seed).choice(
+            len(self.valid_x), min(size, len(self.valid_x)), replace=False))
+        arrays = [array.take(rows, axis=0) for array in
+                  [self.valid_x, self.valid_len, self.valid_sub,
+                   self.valid_y]]
+        return map(self._trim, helper.iter_batches(
+            arrays, batch_size or self.batch_size))
 
     def get_testing(self):
-        """ Get the whole validation set in a vectorized form """
-        old_ind = self._current_test_index
-        self._current_test_index = 0
-        batch_x, batch_sub, batch_y = self.next_test_batch(self.test_size)
-        self._current_test_index = old_ind
-        return batch_x, batch_sub, batch_y
+        """ Get the whole testing set in a vectorized form """
+        return self.test_x, self.test_len, self.test_sub, self.test_y
 
     def next_test_batch(self, batch_size=None):
-        """ Get the next batch of validation data """
+        """ Get the next batch of testing data """
         batch_size = batch_size or self.batch_size
-        batch_x = []
-        batch_sub = []
-        batch_y = []
-        for _ in range(0, batch_size):
-            sentence = self.test_data[self._current_test_index]
-            subreddit = self.test_subreddits[self._current_test_index]
-            label = self.test_labels[self._current_test_index]
-
-            self._current_test_index += 1
-
-            # Support multiple epochs
-            if self._current_test_index >= self.test_size:
-                self._current_test_index = 0
-
-            # Turn sentences and labels into vectors
-            sentence_vec = helper.get_indicies(sentence,
-                                               self.word_dict,
-                                               self.max_title_length)
-
-            subreddit_vec = helper.label_vector(subreddit,
-                                                self.subreddit_dict,
-                                                self.subreddit_count)
-
-            label_vec = helper.label_vector(label.split(), self.users_dict,
-                                            self.user_count)
-            batch_x.append(sentence_vec)
-            batch_sub.append(subreddit_vec)
-            batch_y.append(label_vec)
-        return batch_x, batch_sub, batch_y
+        batch, self._current_test_index, _ = \
+            helper.take_rows([self.test_x, self.test_len, self.test_sub,
+                              self.test_y],
+                             self._current_test_index, batch_size)
+        return self._trim(batch)
 
     def for_n_train_epochs(self, num_epochs=1, batch_size=25):
         # TODO Ta bort parameterar
@@ -264,14 +367,261 @@ class Data(object):
 
     def get_training(self):
         """ Get the whole training set in a vectorized form """
-        old_ind = self._current_train_index
-        old_epoch = self.completed_training_epochs
+        return self.train_x, self.train_len, self.train_sub, self.train_y
+
+    def iter_training(self, batch_size=None, sort_by_length=None):
+        """ Iterates once over the training set in batches, sorted by title
+        length when bucketing unless sort_by_length is False """
+        if sort_by_length is None:
+            sort_by_length = self.bucket_by_length
+        arrays = [self.train_x, self.train_len, self.train_sub, self.train_y]
+        if sort_by_length:
+            arrays = helper.sort_by_length(arrays, self.train_len)
+        return map(self._trim, helper.iter_batches(
+            arrays, batch_size or self.batch_size))
+
+    def iter_training_sample(self, size, batch_size=None):
+        """ Iterates once over a random sample of size rows of the training
+        set in batches, the same sample every time """
+        if self._train_sample is None:
+            arrays = [self.train_x, self.train_len, self.train_sub,
+                      self.train_y]
+            rows = np.sort(np.random.choice(len(self.train_x),
+                                            min(size, len(self.train_x)),
+                                            replace=False))
+            self._train_sample = [array.take(rows, axis=0)
+                                  for array in arrays]
+            if self.bucket_by_length:
+                self._train_sample = helper.sort_by_length(
+                    self._train_sample, self._train_sample[1])
+        return map(self._trim, helper.iter_batches(
+            self._train_sample, batch_size or self.batch_size))
+
+    def shard_training(self, index, count):
+        """ Keeps every count:th training row starting at index, so count
+        workers train on disjoint shards of the training set """
+        rows = np.arange(index, len(self.train_x), count)
+        self.train_x, self.train_len, self.train_sub, self.train_y = \
+            [array.take(rows, axis=0) for array in
+             [self.train_x, self.train_len, self.train_sub, self.train_y]]
+        self.train_size = len(rows)
         self._current_train_index = 0
-        batch_x, batch_sub, batch_y = self.next_train_batch(self.train_size)
-        self._current_train_index = old_ind
-        self.completed_training_epochs = old_epoch
-        return batch_x, batch_sub, batch_y
+        self._current_pre_train_index = 0
+        self._train_sample = None
 
     def get_stats(self):
         """ Returns statistics about embedding matrix """
         return self.train_present, self.train_absent, self.valid_present, self.valid_absent
+
+
+class _ChunkStream(object):
+    """ Serves rows from a never ending iterator of chunks of arrays """
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._chunk = None
+        self._index = 0
+
+    def take(self, size):
+        """ Takes the next size rows from every array of the chunks """
+        parts = []
+        while size > 0:
+            if self._chunk is None or self._index >= len(self._chunk[0]):
+                self._chunk = next(self._chunks)
+                self._index = 0
+            end = min(self._index + size, len(self._chunk[0]))
+            parts.append([array[self._index:end] for array in self._chunk])
+            size -= end - self._index
+            self._index = end
+        if len(parts) == 1:
+            return parts[0]
+        return [helper.concatenate_rows(arrays) for arrays in zip(*parts)]
+
+
+class StreamingData(Data):
+    """
+    Streams the training data from disk in chunks of stream_chunk_size rows
+    instead of keeping it in memory, so memory use doesn't depend on the
+    size of the training set. Validation and testing data are still read
+    into memory. Training samples are drawn from the first chunk.
+    """
+    def __init__(self, networkconfig):
+        self.chunk_size = networkconfig.get(STREAM_CHUNK_SIZE, 10000)
+        self._training_sample = None
+        self._train_stream = None
+        self._pre_train_stream = None
+        # The index of the shard of every chunk and the number of shards
+        self._shard = None
+        super().__init__(networkconfig)
+
+    def _read_training_data(self):
+        """ Counts the training data in one streaming pass, only the first
+        chunk is kept """
+        counts = (collections.Counter(), collections.Counter(),
+                  collections.Counter())
+        self.train_size = 0
+        for columns, chunk_counts in \
+                self.reader.iter_data(Dataenum.TRAINING, self.chunk_size):
+            if self._training_sample is None:
+                self._training_sample = columns
+            ingest.merge_counts(counts, chunk_counts)
+            self.train_size += len(columns[0])
+        if not self.train_size:
+            raise ValueError("The training data is empty")
+        self.reader.counts[Dataenum.TRAINING] = counts
+
+    def _encode_training_data(self):
+        """ Encodes the first chunk of the training data, the rest is
+        encoded while streaming """
+        self.train_x, self.train_len, self.train_sub, self.train_y, \
+            self.train_present, self.train_absent = \
+            self._encode(*self._training_sample)
+        self._training_sample = None
+        self._train_stream = _ChunkStream(self._encoded_chunks())
+
+    def _encoded_chunks(self):
+        """ Yields the training data as encoded chunks, epoch after epoch.
+        When bucketing, the rows of every chunk are grouped into batches of
+        similar lengths """
+        while True:
+            for columns, _ in \
+                    self.reader.iter_data(Dataenum.TRAINING, self.chunk_size):
+                chunk = self._shard_chunk(self._encode(*columns)[:4])
+                if self.bucket_by_length:
+                    order = helper.bucket_order(chunk[1], self.batch_size)
+                    chunk = [array.take(order, axis=0) for array in chunk]
+                yield chunk
+
+    def _encoded_key(self):
+        """ The training data is streamed, so it is never cached encoded """
+        return None
+
+    def _finish_ingest(self):
+        """ Keeps the ingest worker processes, they clean the training data
+        while streaming it """
+
+    def shard_training(self, index, count):
+        """ Keeps every count:th row of every chunk starting at index, so
+        count workers stream disjoint shards of the training set """
+        training_size = self.train_size
+        super().shard_training(index, count)
+        self._shard = index, count
+        full_chunks, last_chunk = divmod(training_size, self.chunk_size)
+        self.train_size = \
+            full_chunks * len(range(index, self.chunk_size, count)) + \
+            len(range(index, last_chunk, count))
+
+    def _shard_chunk(self, chunk):
+        """ The rows of an encoded chunk in the shard of this worker """
+        if self._shard is None:
+            return chunk
+        index, count = self._shard
+        rows = np.arange(index, len(chunk[0]), count)
+        return [array.take(rows, axis=0) for array in chunk]
+
+    def next_train_batch(self, batch_size=None):
+        """ Get the next batch of training data """
+        batch_size = batch_size or self.batch_size
+        batch = self._train_stream.take(batch_size)
+        self.skip_train_batch(batch_size)
+        return self._trim(batch)
+
+    def next_pre_train_batch(self, batch_size=None):
+        """ Get the next batch of training data, labeled by subreddit """
+        batch_size = batch_size or self.batch_size
+        if self._pre_train_stream is None:
+            self._pre_train_stream = _ChunkStream(self._encoded_chunks())
+        batch_x, batch_len, batch_sub, _ = \
+            self._pre_train_stream.take(batch_size)
+        return self._trim([batch_x, batch_len, batch_sub, batch_sub])
+
+    def get_training(self):
+        """ Get the first chunk of the training set in a vectorized form,
+        the whole set is never held in memory """
+        return self.train_x, self.train_len, self.train_sub, self.train_y
+
+    def iter_training(self, batch_size=None, sort_by_length=None):
+        """ Iterates once over the training set in batches, streaming it
+        from disk chunk by chunk. Chunks are sorted by title length when
+        bucketing unless sort_by_length is False """
+        if sort_by_length is None:
+            sort_by_length = self.bucket_by_length
+        batch_size = batch_size or self.batch_size
+        for columns, _ in \
+                self.reader.iter_data(Dataenum.TRAINING, self.chunk_size):
+            chunk = self._shard_chunk(self._encode(*columns)[:4])
+            if sort_by_length:
+                chunk = helper.sort_by_length(chunk, chunk[1])
+            yield from map(self._trim,
+                           helper.iter_batches(chunk, batch_size))
+
+
+class ServingData(object):
+    """
+    The dictionaries and preprocessing settings needed to make predictions,
+    saved next to the checkpoints when training so a model can be served
+    without reading any of the datasets
+    """
+    # Bump whenever the layout of the saved file changes
+    FORMAT_VERSION = 1
+
+    def __init__(self, word_dict, users, subreddit_dict, max_title_length,
+                 vocabulary_size):
+        self.word_dict = word_dict
+        self.users_dict = {user: index for index, user in enumerate(users)}
+        self.rev_users_dict = dict(enumerate(users))
+        self.subreddit_dict = subreddit_dict
+        self.subreddit_count = len(subreddit_dict)
+        self.max_title_length = max_title_length
+        self.vocabulary_size = vocabulary_size
+
+    @staticmethod
+    def save(path, data, vocabulary_size):
+        """ Writes the dictionaries of data, a Data or ServingData, to path,
+        replacing any earlier version atomically """
+        users = [data.rev_users_dict[index]
+                 for index in range(len(data.rev_users_dict))]
+        content = {'version': ServingData.FORMAT_VERSION,
+                   'preprocessing_version': PREPROCESSING_VERSION,
+                   'max_title_length': data.max_title_length,
+                   'vocabulary_size': vocabulary_size,
+                   'word_dict': data.word_dict,
+                   'users': users,
+                   'subreddit_dict': data.subreddit_dict}
+        tmp_path = path + '.tmp%d' % os.getpid()
+        with open(tmp_path, 'w', encoding='UTF-8') as target:
+            json.dump(content, target)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        """ Reads the dictionaries saved when training """
+        with open(path, 'r', encoding='UTF-8') as source:
+            content = json.load(source)
+        if content['version'] != ServingData.FORMAT_VERSION or \
+                content['preprocessing_version'] != PREPROCESSING_VERSION:
+            raise ValueError(path + " was saved by an incompatible version, "
+                             "train the model again to serve it")
+        return ServingData(content['word_dict'], content['users'],
+                           content['subreddit_dict'],
+                           content['max_title_length'],
+                           content['vocabulary_size'])
+
+    @staticmethod
+    def load_or_build(path, networkconfig):
+        """ Reads the dictionaries saved when training. Models trained
+        before they were saved with the checkpoints have them built from
+        the datasets of their config once, and saved """
+        if not os.path.isfile(path):
+            logging.warning("%s is missing, building it from the datasets",
+                            path)
+            try:
+                data = Data(networkconfig)
+            except FileNotFoundError as e:
+                raise FileNotFoundError(
+                    path + " is missing and the datasets to build it from "
+                    "can't be read, export the model again with "
+                    "python main.py --export") from e
+            vocabulary_size = len(data.embedding_matrix) \
+                if data.use_pretrained else data.vocabulary_size
+            ServingData.save(path, data, vocabulary_size)
+        return ServingData.load(path)
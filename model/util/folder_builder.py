@@ -44,13 +44,9 @@ def build_structure(config):
     tensor_dir_valid_to_create = dir_to_create + '/' + TENSOR_DIR_VALID
     checkpoints_dir_to_create = dir_to_create + '/' + CHECKPOINTS_DIR
 
-    if not os.path.exists(tensor_dir_train_to_create):
-        os.makedirs(tensor_dir_train_to_create)
-
-    if not os.path.exists(tensor_dir_valid_to_create):
-        os.makedirs(tensor_dir_valid_to_create)
-
-    if not os.path.exists(checkpoints_dir_to_create):
-        os.makedirs(checkpoints_dir_to_create)
+    # Concurrent runs may create the same directories
+    os.makedirs(tensor_dir_train_to_create, exist_ok=True)
+    os.makedirs(tensor_dir_valid_to_create, exist_ok=True)
+    os.makedirs(checkpoints_dir_to_create, exist_ok=True)
 
     return dir_to_create
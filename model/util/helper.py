@@ -21,119 +21,137 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 # ==============================================================================
-import collections
 import numpy as np
-import tensorflow as tf
+from .labels import LabelMatrix
 
 
-def test_with_custom_file(filename):
-    """ Tests the build_dataset function """
-    word_list = open(filename, 'r').read().split()
-    print('Data size', len(word_list))
-    data, count, dictionary, reverse_dictionary = build_dataset(word_list)
-
-    print(str(count))
-    print(str(data))
-    print(str(dictionary))
-    print(str(reverse_dictionary))
+def build_dictionary(counter, vocabulary_size=50000):
+    """ Builds a dictionary of the most common words in a Counter """
+    dictionary = dict()
+    dictionary['UNK'] = 0
+    for word, _ in counter.most_common(vocabulary_size - 1):
+        dictionary[word] = len(dictionary)
+    reverse_dictionary = dict(zip(dictionary.values(), dictionary.keys()))
+    return dictionary, reverse_dictionary
 
 
-def build_dataset(words, vocabulary_size=50000):
-    """ Builds a dictionary from given words """
-    count = [['UNK', -1]]
-    count.extend(collections.Counter(words).most_common(vocabulary_size - 1))
+def prune_embeddings(word_dict, matrix, words):
+    """ Keeps only the UNK row and the rows of the given words in an
+    embedding matrix. Returns the remapped dictionary and the new matrix """
+    kept = sorted((word_dict[word], word) for word in words
+                  if word in word_dict and word != 'UNK')
     dictionary = dict()
-    for word, _ in count:
+    dictionary['UNK'] = 0
+    for _, word in kept:
         dictionary[word] = len(dictionary)
-    data = list()
-    unk_count = 0
-    for word in words:
-        if word in dictionary:
-            index = dictionary[word]
-        else:
-            index = 0  # dictionary['UNK']
-            unk_count += 1
-        data.append(index)
-    count[0][1] = unk_count
-    reverse_dictionary = dict(zip(dictionary.values(), dictionary.keys()))
-    return data, count, dictionary, reverse_dictionary
+    rows = [0] + [row for row, _ in kept]
+    return dictionary, np.asarray(matrix[rows], dtype=np.float32)
+
+
+def encode_titles(sentences, dictionary, max_words, pad_left=True):
+    """ Turns a list of sentences into an int32 matrix of word IDs, left
+    padded unless pad_left is False. Also returns the length of every
+    sentence, at least 1, and the number of words found and not found in
+    the dictionary """
+    matrix = np.zeros((len(sentences), max_words), dtype=np.int32)
+    lengths = np.ones(len(sentences), dtype=np.int32)
+    words_placed = 0
+    for row, sentence in enumerate(sentences):
+        # Unknown words are marked with -1 so they can be counted below
+        ids = [dictionary.get(word, -1)
+               for word in sentence.split()[:max_words]]
+        if ids:
+            if pad_left:
+                matrix[row, max_words - len(ids):] = ids
+            else:
+                matrix[row, :len(ids)] = ids
+            lengths[row] = len(ids)
+            words_placed += len(ids)
+    unknown = matrix == -1
+    count_absent = int(np.count_nonzero(unknown))
+    matrix[unknown] = 0
+    return matrix, lengths, words_placed - count_absent, count_absent
+
+
+def trim_titles(titles, lengths):
+    """ Cuts the padding after the longest title off a batch of right
+    padded titles """
+    return titles[:, :max(int(np.max(lengths)), 1)] if len(lengths) \
+        else titles
+
+
+def sort_by_length(arrays, lengths):
+    """ Orders the rows of the arrays by length, keeping the order of
+    titles of equal length """
+    order = np.argsort(lengths, kind='stable')
+    return [array.take(order, axis=0) for array in arrays]
+
+
+def bucket_order(lengths, batch_size):
+    """ Orders the rows so that every batch_size consecutive rows have
+    similar lengths. Titles of equal length are shuffled and so are the
+    batches, only the last incomplete batch is kept at the end """
+    order = np.lexsort((np.random.random(len(lengths)), lengths))
+    full = len(order) // batch_size * batch_size
+    batches = order[:full].reshape(-1, batch_size)
+    np.random.shuffle(batches)
+    return np.concatenate([batches.ravel(), order[full:]])
+
+
+def encode_labels(labels, dic, max_users):
+    """ Turns a list of space separated users into a sparse LabelMatrix
+    with ones on those users indicies """
+    return LabelMatrix.from_labels(labels, dic, max_users)
 
 
-def create_matrix(dictionary):
-    """ Creates an identity matrix with size of dictionary """
-    to_len = len(dictionary)
-    matrix = np.identity(to_len)
-    matrix[0][0] = 0  # this will be kinda "default vec" for 'UNK'
+def encode_subreddits(subreddits, dic):
+    """ Turns a list of subreddits into an int32 array of subreddit IDs """
+    return np.array([dic.get(subreddit, 0) for subreddit in subreddits],
+                    dtype=np.int32)
+
+
+def one_hot(indices, depth):
+    """ Turns an array of indices into a float32 one-hot matrix """
+    matrix = np.zeros((len(indices), depth), dtype=np.float32)
+    matrix[np.arange(len(indices)), indices] = 1
     return matrix
 
-def get_indicies(sentence, dictionary, max_words):
-    """ Turns a sentence into a vector of word IDs """
-    # This assumes that the sentence is pre-processed as an array of words
-    sentence = sentence.split()
-    result = [0] * max_words
-    sentence_len = len(sentence)
-    count_present, count_absent = 0, 0
-    if sentence_len < max_words:
-        return pad(sentence, dictionary, max_words)
-    for i, word in enumerate(sentence):
-        if i > max_words-1:
-            return result, count_present, count_absent
-        if word in dictionary:
-            count_present += 1
-            result[i] = dictionary[word]
-        else:
-            count_absent += 1
-            result[i] = 0
-    return result, count_present, count_absent
-
-
-def pad(sentence, dictionary, max_words):
-    result = [0] * max_words
-    sentence_len = len(sentence)
-    count_present, count_absent = 0, 0
-    for i, word in enumerate(sentence):
-        if max_words - sentence_len + i > max_words:
-            return result, count_present, count_absent
-        if word in dictionary:
-            count_present += 1
-            result[max_words - sentence_len + i] = dictionary[word]
-        else:
-            count_absent += 1
-            result[max_words - sentence_len + i] = 0
-    return result, count_present, count_absent
-
-
-def label_vector(users, dic, max_users):
-    """ Turns an array of some users into an array
-    with ones on those users indicies """
-    vector = [0] * max_users
-    for user in users:
-        if user in dic:
-            vector[dic[user]] = 1
-        else:
-            # If unkown user, set user UNK = 1
-            vector[0] = 1
-    return vector
+
+def take_rows(arrays, index, batch_size):
+    """ Takes batch_size rows from each array starting at index, wrapping
+    around at the end. Slices are views unless the batch wraps around.
+    Returns the rows, the next index and the number of wrap arounds """
+    size = len(arrays[0])
+    end = index + batch_size
+    if end <= size:
+        rows = [array[index:end] for array in arrays]
+    else:
+        positions = np.arange(index, end)
+        rows = [array.take(positions, axis=0, mode='wrap')
+                for array in arrays]
+    return rows, end % size, end // size
+
+
+def iter_batches(arrays, batch_size):
+    """ Iterates once over the rows of arrays in slices of batch_size """
+    for start in range(0, len(arrays[0]), batch_size):
+        yield [array[start:start + batch_size] for array in arrays]
+
+
+def concatenate_rows(arrays):
+    """ Stacks the rows of several arrays or LabelMatrix objects """
+    if isinstance(arrays[0], LabelMatrix):
+        return LabelMatrix.concatenate(arrays)
+    return np.concatenate(arrays)
+
 
 def build_subreddit_dict(subreddits):
     """
     Takes a list of all subreddits and creates a dictionary
-    of unique subreddits
+    of unique subreddits to their index, UNK has index 0
     """
-    unk = ['UNK']
-    unique_subs = list(set(subreddits))
-    dictionary = [item for sublist in [unk, unique_subs] for item in sublist]
+    dictionary = dict()
+    dictionary['UNK'] = 0
+    for subreddit in sorted(set(subreddits)):
+        dictionary.setdefault(subreddit, len(dictionary))
     return dictionary
-
-def subreddit_index(subreddit, dic):
-    """ Turns a subreddit into an index """
-    if subreddit in dic:
-        return [dic.index(subreddit)]
-    else:
-        return [0]
-
-def get_val_summary_tensor(tensor):
-    """ Extract value from tensorboard Summary protobuf """
-    summary = tf.summary.Summary.FromString(tensor)
-    return summary.value[0].simple_value
-
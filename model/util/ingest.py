@@ -0,0 +1,188 @@
+# MIT License
+#
+# Copyright (c) 2017 Jonatan Almén, Alexander Håkansson, Jesper Jaxing, Gmal
+# Tchaefa, Maxim Goretskyy, Axel Olivecrona
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+"""
+Chunked, parallel ingest of the CSV datasets. Rows are read in chunks that
+are cleaned and counted by a pool of worker processes, the per-chunk word,
+user and subreddit counts are then merged in order.
+"""
+import os
+import sys
+import csv
+import types
+import logging
+import itertools
+import collections
+import multiprocessing
+from . import normalizer
+
+# By default no more than this many worker processes are started
+MAX_DEFAULT_WORKERS = 8
+
+# The pool shared by every read of this process and its number of workers
+_pool = None
+_pool_workers = 0
+
+
+def default_workers():
+    """ The number of worker processes used unless configured, at most
+    one per core the process may run on """
+    return min(len(os.sched_getaffinity(0)), MAX_DEFAULT_WORKERS)
+
+
+def _get_pool(workers):
+    """ Returns the process pool, which is only started once per process
+    unless the number of workers changes or it is shut down """
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        shutdown_pool()
+        # Forking a process that already runs TensorFlow threads is unsafe
+        context = multiprocessing.get_context('spawn')
+        # Spawned processes import the main module of this process first,
+        # which imports TensorFlow when it is main.py. The workers only
+        # need this module, so they are started without one. A Pool starts
+        # all of them right away, unlike a ProcessPoolExecutor
+        main_module = sys.modules['__main__']
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            _pool = context.Pool(workers)
+        finally:
+            sys.modules['__main__'] = main_module
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown_pool():
+    """ Stops the worker processes of the pool, if started. Called once
+    the datasets are read, so idle workers don't hold on to memory """
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool, _pool_workers = None, 0
+
+
+def iter_row_chunks(file_path, encoding='UTF-8', chunk_size=10000):
+    """ Reads a CSV file and yields its rows in lists of chunk_size rows.
+    Rows without a title, subreddit and label column are skipped """
+    with open(file_path, 'r', encoding=encoding) as csvfile:
+        chunk = []
+        skipped = 0
+        for row in csv.reader(csvfile):
+            if len(row) < 3:
+                skipped += 1
+                continue
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+        if skipped:
+            logging.warning("Skipped %d rows with fewer than 3 columns in %s",
+                            skipped, file_path)
+
+
+def clean_rows(rows, data_column=(0,), sub_column=1, label_column=2):
+    """ Cleans a list of CSV rows into data, subreddit and label columns """
+    columns = [normalizer.normalize_all([row[elem] for row in rows])
+               for elem in data_column]
+    data = [", ".join(col for col in cols if col) for cols in zip(*columns)]
+    subreddits = [row[sub_column] for row in rows]
+    labels = [row[label_column].replace(',', '') for row in rows]
+    return data, subreddits, labels
+
+
+def count_columns(data, subreddits, labels):
+    """ Counts the words, subreddits and users of cleaned columns """
+    words = collections.Counter()
+    users = collections.Counter()
+    for title in data:
+        words.update(title.split())
+    for label in labels:
+        users.update(label.split())
+    return words, users, collections.Counter(subreddits)
+
+
+def merge_counts(total, counts):
+    """ Adds the (words, users, subreddits) counts to the total """
+    for total_counter, counter in zip(total, counts):
+        total_counter.update(counter)
+    return total
+
+
+def _clean_and_count(rows, data_column, sub_column, label_column):
+    columns = clean_rows(rows, data_column, sub_column, label_column)
+    return columns, count_columns(*columns)
+
+
+def map_chunks(function, chunks, workers=1, *args):
+    """ Applies function(chunk, *args) to every chunk and yields the
+    results in order. With more than one worker and more than one chunk the
+    chunks are processed in the process pool, with at most two chunks per
+    worker in flight so memory use stays bounded. """
+    chunks = iter(chunks)
+    # A single chunk isn't worth starting the pool for
+    first_chunks = list(itertools.islice(chunks, 2))
+    chunks = itertools.chain(first_chunks, chunks)
+    if workers <= 1 or len(first_chunks) <= 1:
+        for chunk in chunks:
+            yield function(chunk, *args)
+        return
+
+    pool = _get_pool(workers)
+    pending = collections.deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(function, (chunk,) + args))
+        if len(pending) >= 2 * workers:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def iter_csv(file_path, encoding='UTF-8', data_column=(0,), sub_column=1,
+             label_column=2, chunk_size=10000, workers=1):
+    """ Reads and cleans a CSV file in parallel chunks. Yields the data,
+    subreddit and label columns of each chunk together with its word, user
+    and subreddit counters, in file order. """
+    chunks = iter_row_chunks(file_path, encoding, chunk_size)
+    return map_chunks(_clean_and_count, chunks, workers,
+                      data_column, sub_column, label_column)
+
+
+def read_csv(file_path, encoding='UTF-8', data_column=(0,), sub_column=1,
+             label_column=2, chunk_size=10000, workers=1):
+    """ Reads and cleans a whole CSV file in parallel chunks. Returns the
+    data, subreddit and label columns together with the merged word, user
+    and subreddit counters. """
+    data, subreddits, labels = [], [], []
+    counts = (collections.Counter(), collections.Counter(),
+              collections.Counter())
+    for columns, chunk_counts in iter_csv(file_path, encoding, data_column,
+                                          sub_column, label_column,
+                                          chunk_size, workers):
+        data.extend(columns[0])
+        subreddits.extend(columns[1])
+        labels.extend(columns[2])
+        merge_counts(counts, chunk_counts)
+    return (data, subreddits, labels), counts
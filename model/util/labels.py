@@ -0,0 +1,116 @@
+# MIT License
+#
+# Copyright (c) 2017 Jonatan Almén, Alexander Håkansson, Jesper Jaxing, Gmal
+# Tchaefa, Maxim Goretskyy, Axel Olivecrona
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+"""
+Sparse multi-hot labels. Only the indices of the users of each example are
+stored, so label memory scales with the number of positive labels instead
+of with users times examples.
+"""
+import numpy as np
+
+
+class LabelMatrix(object):
+    """
+    A binary matrix stored in compressed sparse row form. The column indices
+    of the ones of row i are indices[indptr[i]:indptr[i + 1]]. Slices share
+    the indices of the matrix they are taken from.
+    """
+    def __init__(self, indptr, indices, columns):
+        self.indptr = indptr
+        self.indices = indices
+        self.columns = columns
+
+    @classmethod
+    def from_labels(cls, labels, dic, columns):
+        """ Builds a matrix from a list of space separated users, unknown
+        users are mapped to UNK """
+        indptr = np.zeros(len(labels) + 1, dtype=np.int64)
+        indices = []
+        for row, label in enumerate(labels):
+            indices.extend(sorted({dic.get(user, 0)
+                                   for user in label.split()}))
+            indptr[row + 1] = len(indices)
+        return cls(indptr, np.array(indices, dtype=np.int32), columns)
+
+    @classmethod
+    def concatenate(cls, matrices):
+        """ Stacks the rows of several matrices """
+        lengths = np.concatenate([np.diff(matrix.indptr)
+                                  for matrix in matrices])
+        indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        indices = np.concatenate([matrix._row_indices()
+                                  for matrix in matrices])
+        return cls(indptr, indices, matrices[0].columns)
+
+    @property
+    def shape(self):
+        return len(self), self.columns
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __getitem__(self, key):
+        """ Returns a slice of rows, without copying the indices """
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            return self.take(np.arange(len(self))[key])
+        start, stop, _ = key.indices(len(self))
+        stop = max(start, stop)
+        return LabelMatrix(self.indptr[start:stop + 1], self.indices,
+                           self.columns)
+
+    def take(self, rows, axis=0, mode='raise'):
+        """ Gathers rows like numpy.take along the first axis """
+        if axis != 0:
+            raise ValueError("Only rows can be taken from a LabelMatrix")
+        rows = np.take(np.arange(len(self)), rows, mode=mode)
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        # Position of every gathered index in self.indices
+        positions = np.repeat(starts - indptr[:-1], lengths) + \
+            np.arange(indptr[-1])
+        return LabelMatrix(indptr, self.indices[positions], self.columns)
+
+    def _row_indices(self):
+        """ Returns the column indices of the ones in row order """
+        return self.indices[self.indptr[0]:self.indptr[-1]]
+
+    def _rows(self):
+        """ Returns the row of each of the ones """
+        return np.repeat(np.arange(len(self)), np.diff(self.indptr))
+
+    def to_dense(self):
+        """ Returns the matrix as a dense float32 array """
+        dense = np.zeros(self.shape, dtype=np.float32)
+        dense[self._rows(), self._row_indices()] = 1
+        return dense
+
+    def to_sparse(self):
+        """ Returns the indices, values and dense shape of the matrix in the
+        form tf.SparseTensorValue expects """
+        coordinates = np.stack([self._rows(), self._row_indices()], axis=1)
+        return coordinates.astype(np.int64), \
+            np.ones(len(coordinates), dtype=np.float32), \
+            np.array(self.shape, dtype=np.int64)
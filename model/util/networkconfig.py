@@ -25,3 +25,4 @@ from .config import cfg
 
 
 yamlconfig = cfg['network']
+sessionconfig = cfg.get('session')
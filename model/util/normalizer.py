@@ -0,0 +1,67 @@
+# MIT License
+#
+# Copyright (c) 2017 Jonatan Almén, Alexander Håkansson, Jesper Jaxing, Gmal
+# Tchaefa, Maxim Goretskyy, Axel Olivecrona
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+"""
+Text normalisation shared by the data ingest and the prediction endpoint,
+so that served titles are cleaned exactly like the training data
+"""
+import re
+
+NUMBER_TOKEN = 'NUMTOKEN'
+PUNCTUATION = '!?-_.,\'":;%()'
+
+_NUMBER_PATTERN = re.compile(r'\d+')
+# Joins the texts in normalize_all, cleaning never touches it
+_SEPARATOR = '\x00'
+
+
+def _strip_punctuation(text):
+    """ Removes all punctuation characters from a text """
+    # str.translate is much slower than this for non-ASCII text
+    for character in PUNCTUATION:
+        text = text.replace(character, '')
+    return text
+
+
+def normalize(text):
+    """ Replaces each number with NUMTOKEN, removes punctuation and
+    collapses whitespace to single spaces """
+    text = _strip_punctuation(_NUMBER_PATTERN.sub(NUMBER_TOKEN, text))
+    return " ".join(text.split())
+
+
+def normalize_all(texts):
+    """ Normalizes a list of texts, cleaning them all in one pass """
+    if not texts:
+        return []
+    joined = _SEPARATOR.join(texts)
+    if joined.count(_SEPARATOR) != len(texts) - 1:
+        # Some text contains the separator, clean them one at a time
+        return [normalize(text) for text in texts]
+    joined = _strip_punctuation(_NUMBER_PATTERN.sub(NUMBER_TOKEN, joined))
+    return [" ".join(text.split()) for text in joined.split(_SEPARATOR)]
+
+
+def tokenize(text):
+    """ Normalizes a text and splits it into words """
+    return normalize(text).split()
@@ -0,0 +1,140 @@
+# MIT License
+#
+# Copyright (c) 2017 Jonatan Almén, Alexander Håkansson, Jesper Jaxing, Gmal
+# Tchaefa, Maxim Goretskyy, Axel Olivecrona
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+"""
+Post-training quantization of the weights of a trained model, so it can be
+served with a fraction of the memory. Matrices are stored as int8 with a
+float32 scale per row, or as float16, and are converted back to float32 in
+the graph where they are used. Vectors, like biases, are kept as float32.
+"""
+import os
+import json
+import numpy as np
+import tensorflow as tf
+
+# Bump whenever the layout of the exported weights changes
+QUANTIZED_VERSION = 1
+
+QUANTIZED_DTYPES = ('int8', 'float16')
+
+
+def quantize_rows(matrix):
+    """ Quantizes every row of a matrix to int8 symmetrically around 0,
+    returns the int8 values and the float32 scale of every row """
+    scales = np.max(np.abs(matrix), axis=1) / 127.0
+    # Rows of zeros would divide by zero
+    scales[scales == 0] = 1.0
+    values = np.rint(matrix / scales[:, np.newaxis]).astype(np.int8)
+    return values, scales.astype(np.float32)
+
+
+def quantize(array, dtype):
+    """ Quantizes an array of weights to dtype, returns the values and the
+    scale of every row or None """
+    if array.ndim != 2:
+        return array, None
+    if dtype == 'int8':
+        return quantize_rows(array)
+    if dtype == 'float16':
+        return array.astype(np.float16), None
+    raise ValueError("Unknown quantized dtype: " + str(dtype))
+
+
+def export(session, weights, lookup_weights, path, embedding_dtype='int8',
+           weight_dtype='float16'):
+    """
+    Writes the quantized values of the weights, a dict of variables by
+    name, to path. The weights in lookup_weights are quantized to
+    embedding_dtype and the rest to weight_dtype. The sizes of the float32
+    and quantized weights are written to a json file next to it.
+    """
+    arrays = {}
+    float_bytes, quantized_bytes = 0, 0
+    for name, value in zip(weights, session.run(list(weights.values()))):
+        dtype = embedding_dtype if name in lookup_weights else weight_dtype
+        values, scale = quantize(value, dtype)
+        arrays[name] = values
+        float_bytes += value.nbytes
+        quantized_bytes += values.nbytes
+        if scale is not None:
+            arrays[name + '/scale'] = scale
+            quantized_bytes += scale.nbytes
+    np.savez(path, **arrays)
+
+    meta = {'version': QUANTIZED_VERSION,
+            'embedding_dtype': embedding_dtype,
+            'weight_dtype': weight_dtype,
+            'float_bytes': float_bytes,
+            'quantized_bytes': quantized_bytes}
+    with open(os.path.splitext(path)[0] + '.json', 'w') as target:
+        json.dump(meta, target)
+    return meta
+
+
+def load(path):
+    """ Reads exported weights, returns a dict of (values, scale or None)
+    by variable name """
+    with open(os.path.splitext(path)[0] + '.json', 'r') as source:
+        if json.load(source)['version'] != QUANTIZED_VERSION:
+            raise ValueError("The quantized model " + path + " is outdated, "
+                             "export it again")
+    with np.load(path) as arrays:
+        return {name: (arrays[name], arrays[name + '/scale']
+                       if name + '/scale' in arrays.files else None)
+                for name in arrays.files if not name.endswith('/scale')}
+
+
+def dequantize(values, scale=None):
+    """ Converts quantized values back to float32 in the graph """
+    values = tf.cast(values, tf.float32)
+    if scale is None:
+        return values
+    return values * tf.expand_dims(scale, 1)
+
+
+def embedding_lookup(values, scale, ids):
+    """ Looks up rows of quantized values, only the rows looked up are
+    converted back to float32 """
+    rows = tf.cast(tf.nn.embedding_lookup(values, ids), tf.float32)
+    if scale is None:
+        return rows
+    return rows * tf.expand_dims(tf.nn.embedding_lookup(scale, ids), -1)
+
+
+def write_report(sizes, results, path):
+    """ Prints and writes a json report comparing the accuracy and latency
+    of the float32 and quantized models, results holds the metrics of each
+    by name """
+    print("{:<10} {:>10} {:>10} {:>10} {:>12} {:>12}".format(
+        "model", "precision", "recall", "f1_score", "latency_ms",
+        "weights_mb"))
+    for name, weight_bytes in [('float32', sizes['float_bytes']),
+                               ('quantized', sizes['quantized_bytes'])]:
+        metrics = results[name]
+        metrics['weights_mb'] = weight_bytes / 2 ** 20
+        print("{:<10} {:>10.4f} {:>10.4f} {:>10.4f} {:>12.3f} {:>12.2f}"
+              .format(name, metrics['precision'], metrics['recall'],
+                      metrics['f1_score'], metrics['latency'] * 1000,
+                      metrics['weights_mb']))
+    with open(path, 'w') as target:
+        json.dump(dict(sizes, results=results), target, indent=2)
@@ -0,0 +1,152 @@
+# MIT License
+#
+# Copyright (c) 2017 Jonatan Almén, Alexander Håkansson, Jesper Jaxing, Gmal
+# Tchaefa, Maxim Goretskyy, Axel Olivecrona
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+"""
+Sharded TFRecord files of the encoded training data and the tf.data input
+pipeline reading them. Every record holds the word IDs of a title, its
+length, its subreddit ID and the indices of its users.
+"""
+import os
+import json
+import glob
+import hashlib
+import tensorflow as tf
+from .cache import file_digest
+
+# Bump whenever the layout of the records changes
+RECORDS_VERSION = 3
+
+
+def _int64_feature(values):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=values))
+
+
+def _records_stamp(data, training_file):
+    """ Identifies the data and dictionaries the records are encoded with """
+    digest = hashlib.sha1()
+    digest.update(file_digest(training_file).encode())
+    digest.update(json.dumps([data.word_dict, data.users_dict,
+                              data.subreddit_dict],
+                             sort_keys=True).encode())
+    return {'version': RECORDS_VERSION,
+            'train_size': data.train_size,
+            'max_title_length': data.max_title_length,
+            'bucket_by_length': data.bucket_by_length,
+            'digest': digest.hexdigest()}
+
+
+def write_records(records_dir, data, training_file, shards=8,
+                  batch_size=10000):
+    """ Writes the training data to shards of TFRecord files, unless they
+    are already up to date. Returns the paths of the shards. """
+    meta_file = os.path.join(records_dir, 'meta.json')
+    stamp = _records_stamp(data, training_file)
+    if os.path.isfile(meta_file):
+        with open(meta_file, 'r') as source:
+            if json.load(source) == stamp:
+                return sorted(glob.glob(os.path.join(records_dir,
+                                                     'train-*.tfrecord')))
+
+    if not os.path.exists(records_dir):
+        os.makedirs(records_dir)
+    for old_file in glob.glob(os.path.join(records_dir, '*')):
+        os.remove(old_file)
+
+    paths = [os.path.join(records_dir,
+                          'train-%05d-of-%05d.tfrecord' % (shard, shards))
+             for shard in range(shards)]
+    writers = [tf.python_io.TFRecordWriter(path) for path in paths]
+    count = 0
+    # Written in file order, sorted shards would feed the short titles of
+    # every epoch first, group_by_window buckets them instead
+    for batch_x, batch_len, batch_sub, batch_y in \
+            data.iter_training(batch_size, sort_by_length=False):
+        # Trimmed batches are padded back to the same length
+        padding = data.max_title_length - batch_x.shape[1]
+        for row in range(len(batch_x)):
+            users = batch_y.indices[batch_y.indptr[row]:
+                                    batch_y.indptr[row + 1]]
+            example = tf.train.Example(features=tf.train.Features(feature={
+                'input': _int64_feature(batch_x[row].tolist() +
+                                        [0] * padding),
+                'length': _int64_feature([int(batch_len[row])]),
+                'subreddit': _int64_feature([int(batch_sub[row])]),
+                'users': _int64_feature(users.tolist())}))
+            # Round robin over the shards
+            writers[count % shards].write(example.SerializeToString())
+            count += 1
+    for writer in writers:
+        writer.close()
+
+    with open(meta_file, 'w') as target:
+        json.dump(stamp, target)
+    return paths
+
+
+def make_dataset(files, max_title_length, user_count, subreddit_count,
+                 batch_size, use_subreddit_ids=False, shuffle_buffer=10000,
+                 prefetch_batches=4, bucket_width=None):
+    """ Creates a dataset that reads the shards in parallel, shuffles the
+    examples and yields (input, sequence_length, subreddit_input, target)
+    batches forever. With a bucket_width, titles whose lengths fall in the
+    same bucket are batched together and the padding after the longest
+    title of a batch is cut off """
+    # The cores the process is pinned to by the session settings
+    parallel_calls = len(os.sched_getaffinity(0))
+    features = {
+        'input': tf.FixedLenFeature([max_title_length], tf.int64),
+        'length': tf.FixedLenFeature([], tf.int64),
+        'subreddit': tf.FixedLenFeature([], tf.int64),
+        'users': tf.VarLenFeature(tf.int64)}
+
+    def parse(serialized):
+        """ Parses a batch of serialized examples at once """
+        parsed = tf.parse_example(serialized, features)
+        lengths = tf.cast(parsed['length'], tf.int32)
+        titles = tf.cast(parsed['input'], tf.int32)
+        if bucket_width:
+            titles = titles[:, :tf.reduce_max(lengths)]
+        subreddits = tf.cast(parsed['subreddit'], tf.int32)
+        if not use_subreddit_ids:
+            subreddits = tf.one_hot(subreddits, subreddit_count)
+        target = tf.cast(tf.sparse_to_indicator(parsed['users'], user_count),
+                         tf.float32)
+        return titles, lengths, subreddits, target
+
+    def bucket(serialized):
+        """ Buckets a serialized example by the length of its title """
+        length = tf.parse_single_example(
+            serialized, {'length': features['length']})['length']
+        return length // bucket_width
+
+    dataset = tf.data.Dataset.from_tensor_slices(files)
+    dataset = dataset.apply(tf.contrib.data.parallel_interleave(
+        tf.data.TFRecordDataset, cycle_length=len(files), sloppy=True))
+    dataset = dataset.shuffle(shuffle_buffer).repeat()
+    if bucket_width:
+        dataset = dataset.apply(tf.contrib.data.group_by_window(
+            bucket, lambda _, window: window.batch(batch_size), batch_size))
+    else:
+        dataset = dataset.batch(batch_size)
+    dataset = dataset.map(parse, num_parallel_calls=parallel_calls)
+    return dataset.prefetch(prefetch_batches)
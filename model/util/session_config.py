@@ -0,0 +1,97 @@
+# MIT License
+#
+# Copyright (c) 2017 Jonatan Almén, Alexander Håkansson, Jesper Jaxing, Gmal
+# Tchaefa, Maxim Goretskyy, Axel Olivecrona
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+"""
+The TensorFlow session settings of the session block of config.yaml,
+applied the same way when training, sweeping and serving
+"""
+import os
+import json
+import tensorflow as tf
+from definitions import *
+
+# Settings used when neither config.yaml nor the command line sets them,
+# 0 threads lets TensorFlow decide
+DEFAULT_SETTINGS = {
+    INTRA_OP_THREADS: 0,
+    INTER_OP_THREADS: 0,
+    CPU_AFFINITY: None,
+    GRAPH_OPTIMIZATION: 'L1',
+    GLOBAL_JIT: False,
+    ALLOW_GROWTH: False,
+    LOG_DEVICE_PLACEMENT: False,
+}
+
+
+def parse_cores(cores):
+    """ Parses a list of cores like '0-7,16' or [0, 1] into a list """
+    if cores is None or isinstance(cores, list):
+        return cores
+    parsed = []
+    for part in str(cores).split(','):
+        first, _, last = part.strip().partition('-')
+        parsed.extend(range(int(first), int(last or first) + 1))
+    return parsed
+
+
+def session_settings(block=None, overrides=None):
+    """ Merges the session block of config.yaml and the overrides, which
+    are ignored when None, over the default settings """
+    settings = dict(DEFAULT_SETTINGS)
+    for values in (block or {}, overrides or {}):
+        settings.update({key: value for key, value in values.items()
+                         if value is not None})
+    unknown = set(settings) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError("Unknown session settings: " + ", ".join(unknown))
+    settings[CPU_AFFINITY] = parse_cores(settings[CPU_AFFINITY])
+    return settings
+
+
+def session_config(settings):
+    """ Pins the process to the cores of the settings, if any, and returns
+    a ConfigProto of the settings """
+    if settings[CPU_AFFINITY]:
+        os.sched_setaffinity(0, settings[CPU_AFFINITY])
+    config = tf.ConfigProto(
+        intra_op_parallelism_threads=settings[INTRA_OP_THREADS],
+        inter_op_parallelism_threads=settings[INTER_OP_THREADS],
+        log_device_placement=settings[LOG_DEVICE_PLACEMENT])
+    config.gpu_options.allow_growth = settings[ALLOW_GROWTH]
+    optimizer_options = config.graph_options.optimizer_options
+    optimizer_options.opt_level = \
+        getattr(tf.OptimizerOptions, settings[GRAPH_OPTIMIZATION])
+    if settings[GLOBAL_JIT]:
+        optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+    return config
+
+
+def log_settings(settings, logging_dir=None):
+    """ Prints the effective settings and writes them to session.json in
+    the logging directory of a run """
+    effective = dict(settings,
+                     **{CPU_AFFINITY: sorted(os.sched_getaffinity(0))})
+    print("Session settings:", json.dumps(effective, sort_keys=True))
+    if logging_dir is not None:
+        with open(os.path.join(logging_dir, SESSION_LOG), 'w') as target:
+            json.dump(effective, target, indent=2, sort_keys=True)
@@ -25,6 +25,7 @@
 import os
 import csv
 import time
+import fcntl
 from definitions import *
 
 
@@ -43,11 +44,6 @@ def log_samefile(config, f1_score_valid, f1_score_train, epoch_top, prec_valid,
 
     headers = config_headers + additional_headers
 
-    if not os.path.isfile(filename):
-        with open(filename, 'w+') as filedata:
-            writer = csv.DictWriter(filedata, delimiter=',', fieldnames=headers)
-            writer.writeheader()
-
     data = []
     for header in config_headers:
         data.append(config[header])
@@ -64,5 +60,13 @@ def log_samefile(config, f1_score_valid, f1_score_train, epoch_top, prec_valid,
     data.append(time_logged)
 
     with open(filename, 'a+', newline='') as fp:
+        # Configs trained concurrently append to the same file
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        # The offset is that of when the file was opened, another process
+        # may have written since
+        fp.seek(0, os.SEEK_END)
+        if fp.tell() == 0:
+            writer = csv.DictWriter(fp, delimiter=',', fieldnames=headers)
+            writer.writeheader()
         a = csv.writer(fp, delimiter=',')
         a.writerow(data)
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+import collections
+
+import numpy as np
+
+import definitions
+from model.util.cache import DatasetCache, EncodedCache
+
+COLUMNS = (['first title', '', 'Ünïcode title €'],
+           ['AskReddit', 'pics', 'news'],
+           ['alice bob', 'bob', ''])
+
+
+class TestDatasetCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = DatasetCache(self.directory)
+        self.path = os.path.join(self.directory, 'data.csv')
+        with open(self.path, 'w', encoding='UTF-8') as target:
+            target.write('title,subreddit,users\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        key = self.cache.key(self.path, 1)
+        counts = (collections.Counter(a=2), collections.Counter(),
+                  collections.Counter(pics=1))
+        self.cache.save(key, COLUMNS, counts)
+        self.assertEqual(self.cache.load(key), COLUMNS)
+        self.assertEqual(self.cache.load_counts(key), counts)
+
+    def test_missing_entry(self):
+        key = self.cache.key(self.path, 1)
+        self.assertIsNone(self.cache.load(key))
+        self.assertIsNone(self.cache.load_counts(key))
+
+    def test_key_changes_with_contents_and_params(self):
+        key = self.cache.key(self.path, 1, [0], 1)
+        self.assertEqual(key, self.cache.key(self.path, 1, [0], 1))
+        self.assertNotEqual(key, self.cache.key(self.path, 2, [0], 1))
+        self.assertNotEqual(key, self.cache.key(self.path, 1, [0, 1], 1))
+        with open(self.path, 'a', encoding='UTF-8') as target:
+            target.write('title,pics,alice\n')
+        self.assertNotEqual(key, self.cache.key(self.path, 1, [0], 1))
+
+    def test_default_directory_is_resolved_when_created(self):
+        default = definitions.CACHE_PATH
+        definitions.CACHE_PATH = self.directory
+        try:
+            self.assertEqual(DatasetCache().cache_dir, self.directory)
+        finally:
+            definitions.CACHE_PATH = default
+
+
+class TestEncodedCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = EncodedCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        key = self.cache.key('train', ['train-1', 'valid-2'], 8, True)
+        arrays = {'train_x': np.arange(12, dtype=np.int32).reshape(3, 4),
+                  'train_len': np.array([4, 2, 0], dtype=np.int32)}
+        meta = {'word_dict': {'UNK': 0, 'title': 1}, 'sizes': [3, 0, 0]}
+        self.cache.save(key, arrays, meta)
+        loaded, loaded_meta = self.cache.load(key)
+        self.assertEqual(sorted(loaded), sorted(arrays))
+        for name, array in arrays.items():
+            self.assertIsInstance(loaded[name], np.memmap)
+            np.testing.assert_array_equal(loaded[name], array)
+            self.assertEqual(loaded[name].dtype, array.dtype)
+        self.assertEqual(loaded_meta, meta)
+
+    def test_missing_entry(self):
+        self.assertIsNone(self.cache.load(self.cache.key('train', [])))
+
+    def test_key_changes_with_params(self):
+        key = self.cache.key('train', ['train-1'], 8, True)
+        self.assertTrue(key.startswith('train-encoded-'))
+        self.assertEqual(key, self.cache.key('train', ['train-1'], 8, True))
+        self.assertNotEqual(key, self.cache.key('train', ['train-2'], 8,
+                                                True))
+        self.assertNotEqual(key, self.cache.key('train', ['train-1'], 8,
+                                                False))
@@ -0,0 +1,77 @@
+import os
+import glob
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+HAVE_TENSORFLOW = importlib.util.find_spec('tensorflow') is not None
+if HAVE_TENSORFLOW:
+    from model.util.checkpoints import CheckpointWriter
+
+
+class FakeSaver(object):
+    """ Writes empty files named like those of tf.train.Saver """
+    def save(self, session, save_path, global_step, **kwargs):
+        path = '%s-%d' % (save_path, global_step)
+        for suffix in ['.index', '.data-00000-of-00001']:
+            open(path + suffix, 'w').close()
+        return path
+
+
+@unittest.skipUnless(HAVE_TENSORFLOW, 'TensorFlow is not installed')
+class TestCheckpointWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.writer = CheckpointWriter(
+            os.path.join(self.directory, 'models.ckpt'), [], keep_best=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, scores):
+        for epoch, score in enumerate(scores):
+            self.writer._write(None, FakeSaver(), epoch, score)
+
+    def versions_on_disk(self):
+        return sorted(int(path.split('-')[-1].split('.')[0])
+                      for path in glob.glob(os.path.join(self.directory,
+                                                         'models.ckpt-*')))
+
+    def test_keeps_best_and_latest(self):
+        self.write([0.1, 0.5, 0.3, 0.4, 0.2])
+        index = self.writer._read_index()
+        self.assertEqual([c['epoch'] for c in index['checkpoints']],
+                         [1, 3, 4])
+        self.assertEqual(sorted(set(self.versions_on_disk())), [1, 3, 4])
+        self.assertEqual(self.writer.path('best'),
+                         os.path.join(self.directory, 'models.ckpt-1'))
+        self.assertEqual(self.writer.path('latest'),
+                         os.path.join(self.directory, 'models.ckpt-4'))
+
+    def test_unscored_latest_is_replaced(self):
+        self.write([0.2, None, 0.1, None])
+        index = self.writer._read_index()
+        self.assertEqual([c['epoch'] for c in index['checkpoints']],
+                         [0, 2, 3])
+        self.assertEqual(index['latest'],
+                         os.path.join(self.directory, 'models.ckpt-3'))
+
+    def test_best_falls_back_to_latest(self):
+        self.assertIsNone(self.writer.path('best'))
+        self.write([None])
+        self.assertEqual(self.writer.path('best'),
+                         os.path.join(self.directory, 'models.ckpt-0'))
+
+    def test_versions_continue_after_restart(self):
+        self.write([0.3, 0.1])
+        self.writer = CheckpointWriter(
+            os.path.join(self.directory, 'models.ckpt'), [], keep_best=2)
+        self.write([0.2])
+        self.assertEqual(self.writer.path('latest'),
+                         os.path.join(self.directory, 'models.ckpt-2'))
+        self.assertEqual(sorted(set(self.versions_on_disk())), [0, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
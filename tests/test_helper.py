@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+
+from model.util import helper
+from model.util.labels import LabelMatrix
+
+
+class TestHelper(unittest.TestCase):
+    def test_encode_titles(self):
+        dictionary = {'UNK': 0, 'a': 1, 'b': 2}
+        matrix, lengths, present, absent = helper.encode_titles(
+            ['a b', 'b x a c', '', 'a a a a a'], dictionary, 4)
+        np.testing.assert_array_equal(matrix, [[0, 0, 1, 2],
+                                               [2, 0, 1, 0],
+                                               [0, 0, 0, 0],
+                                               [1, 1, 1, 1]])
+        np.testing.assert_array_equal(lengths, [2, 4, 1, 4])
+        self.assertEqual(matrix.dtype, np.int32)
+        self.assertEqual((present, absent), (8, 2))
+
+    def test_encode_titles_right_padded(self):
+        matrix, lengths, _, _ = helper.encode_titles(
+            ['a b', 'b'], {'UNK': 0, 'a': 1, 'b': 2}, 3, pad_left=False)
+        np.testing.assert_array_equal(matrix, [[1, 2, 0], [2, 0, 0]])
+        np.testing.assert_array_equal(lengths, [2, 1])
+
+    def test_take_rows(self):
+        titles = np.arange(10).reshape(5, 2)
+        labels = LabelMatrix(np.arange(6), np.arange(5), 5)
+        (batch_x, batch_y), index, epochs = \
+            helper.take_rows([titles, labels], 1, 3)
+        np.testing.assert_array_equal(batch_x, titles[1:4])
+        np.testing.assert_array_equal(batch_y.to_dense(),
+                                      np.eye(5)[1:4])
+        self.assertEqual((index, epochs), (4, 0))
+
+    def test_take_rows_wraps_around(self):
+        titles = np.arange(5)
+        labels = LabelMatrix(np.arange(6), np.arange(5), 5)
+        (batch_x, batch_y), index, epochs = \
+            helper.take_rows([titles, labels], 3, 4)
+        np.testing.assert_array_equal(batch_x, [3, 4, 0, 1])
+        np.testing.assert_array_equal(batch_y.to_dense(),
+                                      np.eye(5)[[3, 4, 0, 1]])
+        self.assertEqual((index, epochs), (2, 1))
+        _, index, epochs = helper.take_rows([titles], 0, 5)
+        self.assertEqual((index, epochs), (0, 1))
+
+    def test_prune_embeddings(self):
+        word_dict = {'UNK': 0, 'a': 1, 'b': 2, 'c': 3, 'd': 4}
+        matrix = np.arange(10, dtype=np.float64).reshape(5, 2)
+        dictionary, pruned = helper.prune_embeddings(
+            word_dict, matrix, {'d', 'b', 'UNK', 'missing'})
+        self.assertEqual(dictionary, {'UNK': 0, 'b': 1, 'd': 2})
+        np.testing.assert_array_equal(pruned, matrix[[0, 2, 4]])
+        self.assertEqual(pruned.dtype, np.float32)
+
+    def test_build_subreddit_dict(self):
+        dictionary = helper.build_subreddit_dict(
+            ['pics', 'AskReddit', 'pics', 'news'])
+        self.assertEqual(dictionary, {'UNK': 0, 'AskReddit': 1, 'news': 2,
+                                      'pics': 3})
+        self.assertEqual(helper.build_subreddit_dict([]), {'UNK': 0})
+
+    def test_bucket_order(self):
+        np.random.seed(0)
+        lengths = np.random.randint(1, 30, size=103)
+        order = helper.bucket_order(lengths, 10)
+        self.assertEqual(sorted(order), list(range(len(lengths))))
+        # Every full batch holds a run of the lengths in sorted order
+        sorted_lengths = np.sort(lengths)
+        batches = [np.sort(lengths[order[start:start + 10]])
+                   for start in range(0, 100, 10)]
+        runs = sorted(tuple(batch) for batch in batches)
+        expected = sorted(tuple(sorted_lengths[start:start + 10])
+                          for start in range(0, 100, 10))
+        self.assertEqual(runs, expected)
+
+    def test_bucket_order_keeps_the_incomplete_batch_last(self):
+        lengths = np.array([5, 1, 4, 2, 3])
+        for _ in range(10):
+            order = helper.bucket_order(lengths, 2)
+            self.assertEqual(order[-1], 0)
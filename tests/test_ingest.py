@@ -0,0 +1,94 @@
+import os
+import csv
+import shutil
+import tempfile
+import unittest
+import collections
+
+from model.util import ingest
+
+ROWS = [
+    ['First title, with 2 numbers 33', 'AskReddit', 'alice bob'],
+    ['Second (title)!', 'pics', 'bob'],
+    ['', 'funny', 'carol,'],
+    ['Fourth: 50% "off"', 'AskReddit', 'alice dave'],
+    ['fifth   title', 'pics', ''],
+    ['Sixth 1st', 'news', 'eve alice'],
+    ['seventh', 'funny', 'bob carol'],
+]
+
+
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'data.csv')
+        with open(self.path, 'w', encoding='UTF-8', newline='') as target:
+            csv.writer(target).writerows(ROWS)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        ingest.shutdown_pool()
+
+    def test_chunks_keep_file_order(self):
+        chunks = list(ingest.iter_row_chunks(self.path, chunk_size=3))
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 1])
+        self.assertEqual([row for chunk in chunks for row in chunk], ROWS)
+
+    def test_short_rows_are_skipped(self):
+        with open(self.path, 'a', encoding='UTF-8', newline='') as target:
+            csv.writer(target).writerows([['only a title'], []])
+        with self.assertLogs(level='WARNING'):
+            chunks = list(ingest.iter_row_chunks(self.path, chunk_size=3))
+        self.assertEqual([row for chunk in chunks for row in chunk], ROWS)
+
+    def test_pool_is_shut_down(self):
+        list(ingest.map_chunks(len, [[1], [2]], 2))
+        self.assertIsNotNone(ingest._pool)
+        ingest.shutdown_pool()
+        self.assertIsNone(ingest._pool)
+
+    def test_chunked_read_matches_one_chunk(self):
+        expected = ingest.read_csv(self.path, chunk_size=len(ROWS))
+        for chunk_size in [1, 2, 3, 100]:
+            self.assertEqual(ingest.read_csv(self.path,
+                                             chunk_size=chunk_size),
+                             expected, chunk_size)
+
+    def test_pool_matches_serial(self):
+        self.assertEqual(ingest.read_csv(self.path, chunk_size=2, workers=2),
+                         ingest.read_csv(self.path, chunk_size=2))
+
+    def test_columns_and_counts(self):
+        (data, subreddits, labels), (words, users, subs) = \
+            ingest.read_csv(self.path, chunk_size=2)
+        self.assertEqual(len(data), len(ROWS))
+        self.assertEqual(subreddits, [row[1] for row in ROWS])
+        self.assertEqual(labels, [row[2].replace(',', '') for row in ROWS])
+        self.assertEqual(data[1], 'Second title')
+        self.assertEqual(data[2], '')
+        self.assertEqual(words, collections.Counter(
+            word for title in data for word in title.split()))
+        self.assertEqual(users, collections.Counter(
+            user for label in labels for user in label.split()))
+        self.assertEqual(subs, collections.Counter(subreddits))
+
+    def test_merge_counts(self):
+        total = (collections.Counter(a=1), collections.Counter(),
+                 collections.Counter(x=2))
+        ingest.merge_counts(total, (collections.Counter(a=2, b=1),
+                                    collections.Counter(u=1),
+                                    collections.Counter()))
+        self.assertEqual(total, (collections.Counter(a=3, b=1),
+                                 collections.Counter(u=1),
+                                 collections.Counter(x=2)))
+
+    def test_map_chunks_order(self):
+        chunks = [[1] * size for size in [3, 1, 4, 1, 5]]
+        self.assertEqual(list(ingest.map_chunks(len, chunks, 2)),
+                         [3, 1, 4, 1, 5])
+        self.assertEqual(list(ingest.map_chunks(len, [[1, 2]], 2)), [2])
+        self.assertEqual(list(ingest.map_chunks(len, [], 2)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
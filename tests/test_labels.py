@@ -0,0 +1,80 @@
+import unittest
+
+import numpy as np
+
+from model.util.labels import LabelMatrix
+
+
+USERS = {'UNK': 0, 'alice': 1, 'bob': 2, 'carol': 3, 'dave': 4}
+LABELS = ['alice bob', '', 'carol', 'mallory dave alice', 'bob bob',
+          'eve', 'dave carol bob alice']
+# One row per label, unknown users are counted as UNK
+DENSE = np.array([[0, 1, 1, 0, 0],
+                  [0, 0, 0, 0, 0],
+                  [0, 0, 0, 1, 0],
+                  [1, 1, 0, 0, 1],
+                  [0, 0, 1, 0, 0],
+                  [1, 0, 0, 0, 0],
+                  [0, 1, 1, 1, 1]], dtype=np.float32)
+
+
+class TestLabelMatrix(unittest.TestCase):
+    def setUp(self):
+        self.matrix = LabelMatrix.from_labels(LABELS, USERS, len(USERS))
+        self.dense = DENSE
+
+    def test_from_labels(self):
+        np.testing.assert_array_equal(self.matrix.to_dense(), self.dense)
+        self.assertEqual(self.matrix.shape, self.dense.shape)
+
+    def test_slice(self):
+        for start, stop in [(0, 3), (2, 5), (4, 7), (3, 3), (5, 2), (-3, None)]:
+            np.testing.assert_array_equal(self.matrix[start:stop].to_dense(),
+                                          self.dense[start:stop])
+
+    def test_nested_slice(self):
+        np.testing.assert_array_equal(self.matrix[1:6][2:4].to_dense(),
+                                      self.dense[1:6][2:4])
+
+    def test_stepped_slice(self):
+        np.testing.assert_array_equal(self.matrix[1::2].to_dense(),
+                                      self.dense[1::2])
+
+    def test_take(self):
+        rows = np.array([6, 0, 1, 3, 3, 5])
+        np.testing.assert_array_equal(self.matrix.take(rows).to_dense(),
+                                      self.dense.take(rows, axis=0))
+
+    def test_take_of_slice(self):
+        rows = np.array([2, 0, 1])
+        np.testing.assert_array_equal(
+            self.matrix[3:7].take(rows).to_dense(),
+            self.dense[3:7].take(rows, axis=0))
+
+    def test_take_wraps(self):
+        rows = np.array([5, 6, 7, 8])
+        np.testing.assert_array_equal(
+            self.matrix.take(rows, mode='wrap').to_dense(),
+            self.dense.take(rows, axis=0, mode='wrap'))
+
+    def test_take_only_rows(self):
+        with self.assertRaises(ValueError):
+            self.matrix.take([0], axis=1)
+
+    def test_concatenate(self):
+        parts = [self.matrix[:2], self.matrix[2:3], self.matrix[3:3],
+                 self.matrix.take(np.array([6, 4]))]
+        np.testing.assert_array_equal(
+            LabelMatrix.concatenate(parts).to_dense(),
+            np.concatenate([self.dense[:2], self.dense[2:3],
+                            self.dense[3:3], self.dense.take([6, 4], axis=0)]))
+
+    def test_to_sparse(self):
+        indices, values, shape = self.matrix[2:5].to_sparse()
+        dense = np.zeros(shape, dtype=np.float32)
+        dense[indices[:, 0], indices[:, 1]] = values
+        np.testing.assert_array_equal(dense, self.dense[2:5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import re
+import unittest
+
+from model.util import normalizer
+
+
+def old_clean(col):
+    """ The cleaning CsvReader did before the normalizer """
+    col = re.sub(r'\d+', 'NUMTOKEN', col)
+    col = re.sub(r'\s+NUMTOKEN\s+', ' NUMTOKEN ', col)
+    for character in ['!', '?', '-', '_', '.', ',', '\'', '\"', ':', ';',
+                      '%', '(', ')']:
+        col = col.replace(character, '')
+    return col
+
+
+TITLES = [
+    'What is the best 2 player game?',
+    'I\'ve  been   waiting 10,000 years (for this)!',
+    '"Quoted" titles: 50% off; 3-4 days_left...',
+    '   leading and trailing   ',
+    '',
+    'Åäö — unicode 1st 2nd, émigré',
+    'tabs\tand\nnewlines 42',
+    '!?-_.,\'":;%()',
+]
+
+
+class TestNormalizer(unittest.TestCase):
+    def test_tokens_match_old_cleaning(self):
+        for title in TITLES:
+            self.assertEqual(normalizer.tokenize(title),
+                             old_clean(title).split(), title)
+
+    def test_normalize_all_matches_normalize(self):
+        self.assertEqual(normalizer.normalize_all(TITLES),
+                         [normalizer.normalize(title) for title in TITLES])
+
+    def test_normalize_all_with_separator(self):
+        titles = ['a\x00b 1', 'c, d']
+        self.assertEqual(normalizer.normalize_all(titles),
+                         [normalizer.normalize(title) for title in titles])
+
+    def test_normalize_all_empty(self):
+        self.assertEqual(normalizer.normalize_all([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+import importlib.util
+
+import numpy as np
+
+HAVE_TENSORFLOW = importlib.util.find_spec('tensorflow') is not None
+if HAVE_TENSORFLOW:
+    from model.util import quantize
+
+
+@unittest.skipUnless(HAVE_TENSORFLOW, 'TensorFlow is not installed')
+class TestQuantize(unittest.TestCase):
+    def test_quantize_rows(self):
+        matrix = np.array([[1.0, -0.5, 0.25],
+                           [0.0, 0.0, 0.0],
+                           [-254.0, 127.0, 1.0]], dtype=np.float32)
+        values, scales = quantize.quantize_rows(matrix)
+        self.assertEqual(values.dtype, np.int8)
+        self.assertEqual(scales.dtype, np.float32)
+        np.testing.assert_array_equal(values, [[127, -64, 32],
+                                               [0, 0, 0],
+                                               [-127, 64, 0]])
+        np.testing.assert_allclose(scales, [1 / 127.0, 1.0, 2.0])
+
+    def test_quantize_rows_error_is_within_half_a_step(self):
+        matrix = np.random.RandomState(0).randn(20, 8).astype(np.float32)
+        values, scales = quantize.quantize_rows(matrix)
+        error = np.abs(values * scales[:, np.newaxis] - matrix)
+        self.assertTrue(np.all(error <= scales[:, np.newaxis] / 2 + 1e-6))
+
+    def test_vectors_are_kept(self):
+        bias = np.ones(3, dtype=np.float32)
+        values, scale = quantize.quantize(bias, 'int8')
+        self.assertIs(values, bias)
+        self.assertIsNone(scale)
+        with self.assertRaises(ValueError):
+            quantize.quantize(np.ones((2, 2)), 'int4')
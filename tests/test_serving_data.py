@@ -0,0 +1,62 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from model.util.data import ServingData
+
+WORD_DICT = {'UNK': 0, 'first': 1, 'title': 2}
+USERS = ['UNK', 'alice', 'bob']
+SUBREDDIT_DICT = {'UNK': 0, 'AskReddit': 1, 'pics': 2}
+
+
+class TestServingData(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'serving.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        data = ServingData(WORD_DICT, USERS, SUBREDDIT_DICT, 30, 50)
+        ServingData.save(self.path, data, 50)
+        loaded = ServingData.load(self.path)
+        self.assertEqual(loaded.word_dict, WORD_DICT)
+        self.assertEqual(loaded.users_dict, {'UNK': 0, 'alice': 1, 'bob': 2})
+        self.assertEqual(loaded.rev_users_dict, dict(enumerate(USERS)))
+        self.assertEqual(loaded.subreddit_dict, SUBREDDIT_DICT)
+        self.assertEqual(loaded.subreddit_count, 3)
+        self.assertEqual(loaded.max_title_length, 30)
+        self.assertEqual(loaded.vocabulary_size, 50)
+        self.assertEqual(os.listdir(self.directory), ['serving.json'])
+
+    def test_incompatible_version(self):
+        data = ServingData(WORD_DICT, USERS, SUBREDDIT_DICT, 30, 50)
+        ServingData.save(self.path, data, 50)
+        with open(self.path, 'r', encoding='UTF-8') as source:
+            content = json.load(source)
+        content['version'] = ServingData.FORMAT_VERSION + 1
+        with open(self.path, 'w', encoding='UTF-8') as target:
+            json.dump(content, target)
+        with self.assertRaises(ValueError):
+            ServingData.load(self.path)
+
+    def test_load_or_build_without_datasets(self):
+        config = {'training_data': 'missing-train.csv',
+                  'validation_data': 'missing-valid.csv',
+                  'testing_data': 'missing-test.csv',
+                  'max_title_length': 30, 'batch_size': 25,
+                  'use_pretrained': False, 'embedding_size': 10,
+                  'pre_trained_matrix': '', 'vocabulary_size': 50,
+                  'user_count': 3, 'use_data_cache': False}
+        with self.assertLogs(level='WARNING'):
+            with self.assertRaisesRegex(FileNotFoundError, '--export'):
+                ServingData.load_or_build(self.path, config)
+
+    def test_load_or_build_reads_saved_data(self):
+        data = ServingData(WORD_DICT, USERS, SUBREDDIT_DICT, 30, 50)
+        ServingData.save(self.path, data, 50)
+        loaded = ServingData.load_or_build(self.path, {})
+        self.assertEqual(loaded.word_dict, WORD_DICT)
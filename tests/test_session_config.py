@@ -0,0 +1,37 @@
+import unittest
+import importlib.util
+
+from definitions import INTRA_OP_THREADS, INTER_OP_THREADS, CPU_AFFINITY, \
+    GRAPH_OPTIMIZATION
+
+HAVE_TENSORFLOW = importlib.util.find_spec('tensorflow') is not None
+if HAVE_TENSORFLOW:
+    from model.util import session_config
+
+
+@unittest.skipUnless(HAVE_TENSORFLOW, 'TensorFlow is not installed')
+class TestSessionSettings(unittest.TestCase):
+    def test_parse_cores(self):
+        self.assertEqual(session_config.parse_cores('0-3,8, 10-11'),
+                         [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(session_config.parse_cores(5), [5])
+        self.assertEqual(session_config.parse_cores([2, 4]), [2, 4])
+        self.assertIsNone(session_config.parse_cores(None))
+
+    def test_defaults(self):
+        self.assertEqual(session_config.session_settings(),
+                         session_config.DEFAULT_SETTINGS)
+
+    def test_overrides_take_precedence(self):
+        settings = session_config.session_settings(
+            {INTRA_OP_THREADS: 4, INTER_OP_THREADS: 2, CPU_AFFINITY: '0-1'},
+            {INTRA_OP_THREADS: 8, INTER_OP_THREADS: None})
+        self.assertEqual(settings[INTRA_OP_THREADS], 8)
+        self.assertEqual(settings[INTER_OP_THREADS], 2)
+        self.assertEqual(settings[CPU_AFFINITY], [0, 1])
+        self.assertEqual(settings[GRAPH_OPTIMIZATION],
+                         session_config.DEFAULT_SETTINGS[GRAPH_OPTIMIZATION])
+
+    def test_unknown_setting(self):
+        with self.assertRaises(ValueError):
+            session_config.session_settings({'intra_threads': 4})
@@ -0,0 +1,22 @@
+import unittest
+import importlib.util
+
+HAVE_TENSORFLOW = importlib.util.find_spec('tensorflow') is not None
+if HAVE_TENSORFLOW:
+    from model.sweep import core_sets
+
+
+@unittest.skipUnless(HAVE_TENSORFLOW, 'TensorFlow is not installed')
+class TestCoreSets(unittest.TestCase):
+    def test_as_many_workers_as_sets(self):
+        self.assertEqual(core_sets(0, 4, list(range(8))),
+                         [[0, 1, 2, 3], [4, 5, 6, 7]])
+        self.assertEqual(core_sets(0, 3, list(range(8))),
+                         [[0, 1, 2], [3, 4, 5]])
+
+    def test_workers_share_cores_when_too_few(self):
+        self.assertEqual(core_sets(3, 2, [4, 5, 6, 7]),
+                         [[4, 5], [6, 7], [4, 5]])
+
+    def test_cores_per_worker_is_capped(self):
+        self.assertEqual(core_sets(0, 8, [0, 1]), [[0, 1]])